@@ -28,7 +28,10 @@ setup(
     ],
     include_package_data=True,
     package_data={
-        'terranet': ['topo/.komondor/**/*',
+        # Only the shipped configs and results, not the runtime state of
+        # the caches
+        'terranet': ['topo/.komondor/*/input/*.cfg',
+                     'topo/.komondor/*/output/*.cfg',
                      'ryu/app/cfg/*.conf']
     },
     scripts=['terranet/examples/run_virtual_fiber_net.py',
@@ -43,6 +43,9 @@ class ConfigAPI(Flask):
         self.add_url_rule("/channel", "switch_channel", self.switch_channel,
                           methods=["POST"])
 
+        self.add_url_rule("/channels", "switch_channels",
+                          self.switch_channels, methods=["POST"])
+
     def get_config(self):
         return jsonify(self.node.komondor_config)
 
@@ -63,3 +66,24 @@ class ConfigAPI(Flask):
         else:
             # TODO add error message
             abort(400)
+
+    def switch_channels(self):
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or \
+                not isinstance(payload.get("channels"), dict) or \
+                not payload["channels"]:
+            abort(400, description='Expected a JSON object '
+                                   '{"channels": {<ssid>: <channel>, ...}}.')
+        channels = {}
+        for ssid, channel_num in payload["channels"].items():
+            if not isinstance(channel_num, int) or \
+                    isinstance(channel_num, bool) or \
+                    channel_num not in Channel.channel_map:
+                abort(400, description="Unknown channel {!r} for access "
+                                       "point {}.".format(channel_num, ssid))
+            channels[ssid] = Channel(channel_num)
+        (success, message) = self.node.switch_channels(channels)
+        if success:
+            return "{}".format(message)
+        else:
+            abort(400, description=message)
@@ -43,6 +43,20 @@ class ChannelSwitchEvent(TerranetEvent):
         super().__init__()
 
 
+class MultiChannelSwitchEvent(TerranetEvent):
+    def __init__(self, node,
+                 new_channel_configs,
+                 old_channel_configs=None):
+        # Channel configs map the switched access points to their config.
+        # Missing old configs are read when the switch is staged.
+        self.node = node
+        if old_channel_configs is None:
+            old_channel_configs = {}
+        self.old_channel_configs = old_channel_configs
+        self.new_channel_configs = new_channel_configs
+        super().__init__()
+
+
 class Sub6GhzEmulatorRegistrationEvent(TerranetEvent):
     def __init__(self, node):
         self.node = node
@@ -1,12 +1,85 @@
+import os
+import tempfile
+
+from mininet.log import error
 from mininet.link import TCLink
 from ipmininet.link import IPIntf, TCIntf
 
 
+class TcBatch(object):
+    """Collects the tc commands for the interfaces of a node and runs them
+    with a single tc -batch call.
+    """
+    def __init__(self, node, tc='tc'):
+        self.node = node
+        self.tc = tc
+        self.cmds = []
+        self.intfs = []
+
+    def add(self, intf, cmd):
+        '''
+        Adds cmd in mininet's format, i.e. '%s qdisc ... dev %s ...'.
+        '''
+        self.cmds.append((cmd % ('', intf)).strip())
+        if intf not in self.intfs:
+            self.intfs.append(intf)
+
+    def apply(self):
+        '''
+        Runs all collected commands. With -force tc continues after a
+        failed command. Returns the tc output, which is empty on success.
+        '''
+        if not self.cmds:
+            return ''
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.tc',
+                                         delete=False) as f:
+            f.writelines('{}\n'.format(cmd) for cmd in self.cmds)
+        try:
+            output = self.node.cmd(self.tc, '-force', '-batch', f.name)
+        finally:
+            os.remove(f.name)
+        if output != '':
+            error("*** Error: {}".format(output))
+        self.cmds = []
+        return output
+
+
 class TerraIntf(TCIntf):
     def __init__(self, bwParamMax=10000, *args, **kwargs):
         self.bwParamMax = bwParamMax
+        self.offload_configured = False
         super(TerraIntf, self).__init__(*args, **kwargs)
 
+    def config(self, *args, **kwargs):
+        result = super(TerraIntf, self).config(*args, **kwargs)
+        self.offload_configured = True
+        return result
+
+    def shape(self, bw, delay, latency_ms=None, batch=None):
+        '''
+        Sets rate and delay with the tbf and netem qdiscs config(bw=...,
+        delay=..., use_tbf=True) uses. Existing qdiscs are replaced in
+        place. With batch the commands are added to the TcBatch of the
+        node. Returns False if tc failed.
+        '''
+        if not self.offload_configured:
+            self.cmd('ethtool -K', self, 'gro off tx on rx on')
+            self.offload_configured = True
+        if latency_ms is None:
+            latency_ms = 15.0 * 8 / bw
+        cmds = ['%%s qdisc replace dev %%s root handle 5: tbf '
+                'rate %fMbit burst 15000 latency %fms' % (bw, latency_ms),
+                '%%s qdisc replace dev %%s parent 5:1 handle 10: '
+                'netem delay %s' % delay]
+        if batch is not None:
+            for cmd in cmds:
+                batch.add(self, cmd)
+            return True
+        for cmd in cmds:
+            if self.tc(cmd) != '':
+                return False
+        return True
+
 
 class TerraLink(TCLink):
     def __init__(self,
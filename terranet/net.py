@@ -14,11 +14,26 @@ from .influx.switchstats import SwitchstatsContinuousQueries
 
 
 class Terranet(IPNet):
+    """IPNet with emulated Sub-6 GHz WiFi links.
+
+    komondor_args, komondor_seeds, komondor_max_seeds and
+    komondor_precision configure the Komondor runs of the
+    Sub6GhzEmulator, build_komondor_args are passed to
+    Sub6GhzEmulator.build_komondor when the network is built, e.g.
+    {'prune_symmetric': True, 'decompose': True} or {'lazy': True,
+    'interim_policy': 'wait'}. They are ignored if sub6ghz_emulator is
+    given.
+    """
     def __init__(self,
                  topo=None,
                  komondor_system_cfg=None,
                  sub6ghz_emulator=None,
                  komondor_config_dir=None,
+                 komondor_args=None,
+                 komondor_seeds=1,
+                 komondor_max_seeds=None,
+                 komondor_precision=0.05,
+                 build_komondor_args=None,
                  router=DistributionNode60,
                  config=OpenrRouterConfig,
                  link=IPLink,
@@ -34,8 +49,15 @@ class Terranet(IPNet):
         if not sub6ghz_emulator:
             sub6ghz_emulator = Sub6GhzEmulator(
                 net=self,
+                komondor_args=komondor_args,
+                komondor_seeds=komondor_seeds,
+                komondor_max_seeds=komondor_max_seeds,
+                komondor_precision=komondor_precision,
                 komondor_config_dir=komondor_config_dir)
         self.sub6ghz_emulator = sub6ghz_emulator
+        if build_komondor_args is None:
+            build_komondor_args = {}
+        self.build_komondor_args = build_komondor_args
         super().__init__(topo=topo,
                          router=router,
                          config=config,
@@ -48,7 +70,8 @@ class Terranet(IPNet):
         super().build()
         for node in self.wifi_nodes():
             node.register_sub6ghz_emulator(self.sub6ghz_emulator)
-        if not self.sub6ghz_emulator.build_komondor():
+        if not self.sub6ghz_emulator.build_komondor(
+                **self.build_komondor_args):
             self.sub6ghz_emulator = None
 
         if self.sub6ghz_emulator:
@@ -65,6 +88,8 @@ class Terranet(IPNet):
 
     def stop(self):
         super().stop()
+        if self.sub6ghz_emulator:
+            self.sub6ghz_emulator.shutdown()
         CustomerstatsContinuousQueries.drop_cqs()
         SwitchstatsContinuousQueries.drop_cqs()
 
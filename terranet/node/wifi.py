@@ -9,7 +9,7 @@ from ..link import WifiLink
 from ..config_api import ConfigAPI
 from ..proxy import NamespaceProxy
 from ..event import KomondorConfigChangeEvent, ChannelSwitchEvent, \
-        Sub6GhzEmulatorRegistrationEvent, \
+        MultiChannelSwitchEvent, Sub6GhzEmulatorRegistrationEvent, \
         Sub6GhzEmulatorCancelRegistrationEvent
 
 from .router import TerranetRouter
@@ -141,18 +141,23 @@ class ConfigurableWifiAccessPoint(WifiAccessPoint):
         info('Proxy started at process {}.\n'.format(proxy.process.pid))
         return proxy
 
-    def switch_channel(self, channel, primary_channel=None):
+    @staticmethod
+    def channel_config_for(channel, primary_channel=None):
         channel_params = channel.komondor_channel_params
         if not primary_channel:
             primary_channel = channel_params["min_channel_allowed"]
         min_channel_allowed = channel_params["min_channel_allowed"]
         max_channel_allowed = channel_params["max_channel_allowed"]
         central_freq = channel_params["central_freq"]
+        return {"primary_channel": primary_channel,
+                "min_channel_allowed": min_channel_allowed,
+                "max_channel_allowed": max_channel_allowed,
+                "central_freq": central_freq}
+
+    def switch_channel(self, channel, primary_channel=None):
         old_channel_cfg = self.get_channel_config()
-        new_channel_cfg = {"primary_channel": primary_channel,
-                           "min_channel_allowed": min_channel_allowed,
-                           "max_channel_allowed": max_channel_allowed,
-                           "central_freq": central_freq}
+        new_channel_cfg = self.channel_config_for(
+            channel, primary_channel=primary_channel)
         self.update_komondor_config(new_channel_cfg)
         evt = ChannelSwitchEvent(self,
                                  old_channel_cfg,
@@ -160,6 +165,27 @@ class ConfigurableWifiAccessPoint(WifiAccessPoint):
         self.notify_sub6ghz_emulator(evt)
         return (evt.result, evt.message)
 
+    def switch_channels(self, channels):
+        '''
+        Switches the channels of several access points of the emulated
+        network at once, so the emulator applies a single new config.
+        channels maps the SSIDs of the access points to their new channel.
+        '''
+        if not self.sub6ghz_emulator:
+            return (False, "No Sub6GhzEmulator registered.\n")
+        aps = {ap.komondor_config["wlan_code"]: ap
+               for ap in self.sub6ghz_emulator.net.access_points()}
+        unknown = [ssid for ssid in channels if ssid not in aps]
+        if unknown:
+            return (False, "Unknown SSIDs {}.\n".format(unknown))
+        # The emulator applies the configs within its channel switch
+        # transaction
+        new_channel_cfgs = {aps[ssid]: self.channel_config_for(channel)
+                            for ssid, channel in channels.items()}
+        evt = MultiChannelSwitchEvent(self, new_channel_cfgs)
+        self.notify_sub6ghz_emulator(evt)
+        return (evt.result, evt.message)
+
     def terminate(self):
         if self.proxy and self.proxy.process:
             try:
@@ -1,16 +1,21 @@
 import os
-import functools
+import time
+import collections
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ryu import cfg
 import oslo_config
 from ryu.controller.handler import set_ev_cls
 from ryu.lib import hub
 
-from terranet.wifi.komondor_config import KomondorConfig, \
-                                          read_komondor_configs, \
-                                          read_komondor_results
+from terranet.wifi.komondor_config import KomondorConfig
+from terranet.wifi.komondor_cache import KomondorCache
+from terranet.wifi.komondor_store import KomondorFileMapping
+from terranet.wifi.objectives import OBJECTIVES
 
 from .customer_flow_pipeline import EventCustomerFlowAdded, \
     EventCustomerFlowRemoved
@@ -23,7 +28,33 @@ opts = (cfg.StrOpt('topo', default='HybridVirtualFiberTopo',
         oslo_config.cfg.DictOpt('ssids', default={},
                                 help='DN id to WiFi SSID mapping'),
         oslo_config.cfg.DictOpt('proxy_ports', default={},
-                                help='DN id to NamespaceProxy port mapping')
+                                help='DN id to NamespaceProxy port mapping'),
+        cfg.StrOpt('objective', default='jainXtpt',
+                   help='Objective maximized by the oracle, one of {}'
+                        .format(', '.join(sorted(OBJECTIVES)))),
+        oslo_config.cfg.DictOpt('weights', default={},
+                                help='SSID to weight mapping of the weighted '
+                                     'objective, defaults to 1'),
+        cfg.FloatOpt('alpha', default=1.0,
+                     help='Fairness parameter of the alphaFair objective'),
+        cfg.IntOpt('decision_cache_size', default=1024,
+                   help='Number of customer distributions the oracle '
+                        'remembers the best configuration for'),
+        cfg.FloatOpt('request_timeout', default=5.0,
+                     help='Timeout in seconds of a channel switch request'),
+        cfg.IntOpt('request_retries', default=2,
+                   help='Retries of a failed channel switch request'),
+        cfg.BoolOpt('skip_unchanged', default=True,
+                    help='Do not send channel switches to DNs already '
+                         'using the channel'),
+        cfg.BoolOpt('batch_switch', default=True,
+                    help='Switch the channels of several DNs with a single '
+                         'request, so the emulator applies one config'),
+        cfg.StrOpt('score_on', default='mean',
+                   choices=['mean', 'lcb'],
+                   help='Score configurations on the mean WLAN throughput '
+                        'or on the lower bound of its 95% confidence '
+                        'interval over the simulated seeds')
         )
 cfg.CONF.register_opts(opts, 'channel_oracle')
 
@@ -50,17 +81,44 @@ class ChannelAssignmentOracle(CustomerAllocationMonitor):
         self.komondor_config_dir = os.path.abspath(komondor_config_dir)
         self.komondor_input_dir = f'{self.komondor_config_dir}/input'
         self.komondor_output_dir = f'{self.komondor_config_dir}/output'
+        self.komondor_cache = KomondorCache(self.komondor_config_dir)
+        self.komondor_store = self.komondor_cache.store
         self.komondor_configs, self.komondor_results = \
             self._read_komondor_cache()
+        self.komondor_files, self.komondor_wlans, self.wlan_throughputs = \
+            self._build_throughput_matrix()
+        self.objective = self.CONF.objective
+        if self.objective not in OBJECTIVES:
+            raise ValueError('ChannelAssignmentOracle: Unknown objective {}.'
+                             .format(self.objective))
+        self.logger.info('ChannelAssignmentOracle: Using objective {}.'
+                         .format(self.objective))
+        self.decisions = collections.OrderedDict()
+        self.decision_cache_hits = 0
+        self.decision_cache_misses = 0
+        self.komondor_store_version = self.komondor_store.data_version()
+        self.dn_channels = {}
+        self.session = self._create_session()
 
     def _read_komondor_cache(self):
-        configs = read_komondor_configs(self.komondor_input_dir)
-        results = read_komondor_results(self.komondor_output_dir)
+        self.komondor_cache.load()
+        # Restrict to the configs of the last built topology, the cache may
+        # hold results of other topology variants.
+        files = self.komondor_cache.read_manifest()
+        if files is None:
+            files = self.komondor_store.result_files()
+        configs = KomondorFileMapping(
+            files,
+            lambda x: KomondorConfig(os.path.join(self.komondor_input_dir, x)))
+        results = self.komondor_store.results(files)
         return (configs, results)
 
     @set_ev_cls(EventCustomerFlowAdded)
     def _customer_flow_added_handler(self, ev):
-        super()._customer_flow_added_handler(ev)
+        self.logger.debug('ChannelAssignmentOracle: Received event '
+                          '{}.'.format(ev.__class__.__name__))
+        if not self._allocate_customer(ev.customer_ipv6):
+            return self.customer_allocation
         channel_configs = self._channel_configurations()
         if channel_configs:
             self.assign_channels(channel_configs)
@@ -68,110 +126,245 @@ class ChannelAssignmentOracle(CustomerAllocationMonitor):
 
     @set_ev_cls(EventCustomerFlowRemoved)
     def _customer_flow_removed_handler(self, ev):
-        super()._customer_flow_removed_handler(ev)
+        self.logger.debug('ChannelAssignmentOracle: Received event '
+                          '{}.'.format(ev.__class__.__name__))
+        if not self._release_customer(ev.customer_ipv6):
+            return self.customer_allocation
         channel_configs = self._channel_configurations()
         if channel_configs:
             self.assign_channels(channel_configs)
         return self.customer_allocation
 
-    def assign_channels(self, channel_configs):
+    def _create_session(self):
+        '''
+        Session with a connection pool large enough to reach all DNs at
+        once. Channel switches are idempotent, so POSTs are retried too.
+        '''
+        pool_size = max(len(self.CONF.proxy_ports), 1)
+        # urllib3 < 1.26 calls allowed_methods method_whitelist, a false
+        # value retries all methods in both
+        if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS'):
+            retry_methods = {'allowed_methods': None}
+        else:
+            retry_methods = {'method_whitelist': False}
+        retries = Retry(total=self.CONF.request_retries,
+                        backoff_factor=0.1,
+                        status_forcelist=(502, 503, 504),
+                        raise_on_status=False,
+                        **retry_methods)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        return session
+
+    def _channel_delta(self, channel_configs):
+        '''
+        Returns a dict mapping the DNs whose channel differs from the last
+        applied one to their new channel.
+        '''
+        switches = {}
         for dn_id, conf in channel_configs.items():
             channel = conf['channel']
-            port = int(self.CONF.proxy_ports[str(dn_id)])
-            self._request_channel_switch(channel, port)
+            if (self.CONF.skip_unchanged and
+                    self.dn_channels.get(dn_id) == channel):
+                continue
+            switches[dn_id] = channel
+        return switches
+
+    def assign_channels(self, channel_configs):
+        '''
+        Sends the channel switches of all DNs whose channel changed and
+        waits for the responses. Several switches are sent as one batch
+        request or concurrently. Returns a dict mapping the DN ids to the
+        responses, None if the request failed.
+        '''
+        start = time.time()
+        switches = self._channel_delta(channel_configs)
+        if not switches:
+            self.logger.info('ChannelAssignmentOracle: Channels of all DNs '
+                             'unchanged.')
+            return {}
+        if self.CONF.batch_switch and len(switches) > 1:
+            r = self._request_channels_switch(switches)
+            responses = {dn_id: r for dn_id in switches}
+        else:
+            threads = {}
+            for dn_id, channel in switches.items():
+                port = int(self.CONF.proxy_ports[str(dn_id)])
+                threads[dn_id] = hub.spawn(self._request_channel_switch,
+                                           channel, port)
+            hub.joinall(threads.values())
+            responses = {dn_id: thread.wait()
+                         for dn_id, thread in threads.items()}
+        for dn_id, r in responses.items():
+            if r is not None and r.ok:
+                self.dn_channels[dn_id] = switches[dn_id]
+            else:
+                # The channel of the DN is unknown now
+                self.dn_channels.pop(dn_id, None)
+        elapsed = time.time() - start
+        failed = [dn_id for dn_id, r in responses.items()
+                  if r is None or not r.ok]
+        self.logger.info('ChannelAssignmentOracle: Switched channels of {} '
+                         'DNs in {:.3f} seconds ({} unchanged, {} failed).'
+                         .format(len(responses) - len(failed), elapsed,
+                                 len(channel_configs) - len(switches),
+                                 len(failed)))
+        return responses
+
+    def _request_channels_switch(self, switches, host='http://localhost'):
+        '''
+        Posts the channels of several DNs to the proxy of one of them. The
+        emulator switches all of them at once.
+        '''
+        port = int(self.CONF.proxy_ports[str(next(iter(switches)))])
+        channels = {self.CONF.ssids[str(dn_id)]: channel
+                    for dn_id, channel in switches.items()}
+        return self._post(f'{host}:{port}/channels', {'channels': channels})
 
     def _request_channel_switch(self, channel, port,
                                 host='http://localhost'):
-        url = f'{host}:{port}/channel'
-        payload = {'channel': channel}
+        return self._post(f'{host}:{port}/channel', {'channel': channel})
+
+    def _post(self, url, payload):
         self.logger.info('ChannelAssignmentOracle: Posting channel switch '
                          'url {} payload {}.'.format(url, payload))
-        r = requests.post(url, json=payload)
+        try:
+            r = self.session.post(url, json=payload,
+                                  timeout=self.CONF.request_timeout)
+        except requests.RequestException as e:
+            self.logger.error('ChannelAssignmentOracle: Channel switch url {} '
+                              'failed: {}.'.format(url, e))
+            return None
         self.logger.info('ChannelAssignmentOracle: Channel switch response code '
                          '{}, message {}.'.format(r.status_code, r.text))
         return r
 
+    def _build_throughput_matrix(self):
+        '''
+        Preloads the WLAN throughputs of all results into a matrix with a
+        row per result file and a column per configured SSID.
+        '''
+        files = list(self.komondor_results)
+        wlans = sorted(self.CONF.ssids.values())
+        rows = {fname: i for i, fname in enumerate(files)}
+        columns = {wlan: j for j, wlan in enumerate(wlans)}
+        matrix = np.zeros((len(files), len(wlans)))
+        for fname, wlan, throughput in self.komondor_store.wlan_throughputs():
+            i = rows.get(fname)
+            if i is None:
+                continue
+            assert wlan in columns
+            matrix[i, columns[wlan]] = throughput
+        if self.CONF.score_on == 'lcb':
+            # Results of a single seed have no interval and keep their mean
+            for fname, summary in self.komondor_store.wlan_stats():
+                i = rows.get(fname)
+                if i is None:
+                    continue
+                matrix[i, columns[summary.wlan]] = summary.throughput_lcb()
+        self.logger.info('ChannelAssignmentOracle: Loaded {} komondor '
+                         'results for ssids {}.'.format(len(files), wlans))
+        return (files, wlans, matrix)
+
     def _channel_configurations(self):
-        oracle_dict = {}
         if len(self.CONF.ssids) > len(self.customer_allocation):
             self.logger.warn('ChannelAssignmentOracle: Not all DNs have been '
                              'added to the database yet. Skipping channel '
                              'assignment.')
             return None
-        res = sorted(self._compute_oracle_dict(),
-                     key=lambda x: x['jainXtpt'],
-                     reverse=True)
-        best = res[0]
+        self._check_komondor_store()
+        if not self.komondor_files:
+            self.logger.warn('ChannelAssignmentOracle: No komondor results '
+                             'available. Skipping channel assignment.')
+            return None
+        customer_counts = self._customer_counts()
+        key = tuple(customer_counts.tolist())
+        decision = self.decisions.get(key)
+        if decision:
+            self.decision_cache_hits += 1
+            self.decisions.move_to_end(key)
+        else:
+            self.decision_cache_misses += 1
+            decision = self._best_configuration(customer_counts)
+            self.decisions[key] = decision
+            if len(self.decisions) > self.CONF.decision_cache_size:
+                self.decisions.popitem(last=False)
+        best, oracle_dict = decision
         self.logger.info('ChannelAssignmentOracle: Best configuration {} for '
-                         'current customer distribution {}.'
-                         .format(best, self.customer_allocation))
+                         'current customer distribution {} ({}).'
+                         .format(best, self.customer_allocation,
+                                 self.decision_cache_info()))
+        return oracle_dict
+
+    def _best_configuration(self, customer_counts):
+        oracle_dict = {}
+        scores = self._compute_oracle_scores(customer_counts)
+        i = int(np.argmax(scores[self.objective]))
+        best = {key: float(value[i]) for key, value in scores.items()}
+        best['file'] = self.komondor_files[i]
+        best['wlan_throughputs'] = dict(
+            zip(self.komondor_wlans, self.wlan_throughputs[i].tolist()))
 
-        komondor_config = KomondorConfig(cfg_file=best['config_file'])
-        dn_channel_configs = komondor_config.ap_channel_configurations()
+        dn_channel_configs = self.komondor_store.ap_channel_configurations(
+            best['file'])
         for config in dn_channel_configs:
             ssid = config['wlan_code']
             dn_id = self.get_dn_id_by_ssid(ssid)
             channel = config['channel']
             oracle_dict[dn_id] = {'channel': channel}
-        return oracle_dict
+        return (best, oracle_dict)
 
-    def _compute_oracle_dict(self):
-        metrics_list = []
-        for file, result in self.komondor_results.items():
-            result_file = os.path.join(self.komondor_output_dir, file)
-            config_file = os.path.join(self.komondor_input_dir, file)
-            result_metrics = self._analyse_komondor_result(result)
-            result_metrics['result_file'] = result_file
-            result_metrics['config_file'] = config_file
-            metrics_list.append(result_metrics)
-        return metrics_list
-
-    def _analyse_komondor_result(self, komondor_result):
-        configured_ssids = sorted(
-            [x for x in self.CONF.ssids.values()])
-        ssids = komondor_result.wlans()
-        assert configured_ssids == ssids
-
-        total_throughput = komondor_result.total_throughput()
-        wlan_throughputs = self._extract_wlan_throughputs(komondor_result)
-        throughputs = functools.reduce(
-            lambda x, y: [*x, *y['customer_throughputs']],
-            wlan_throughputs.values(), [])
-        fairness_index = self._calculate_jains_fairness_index(throughputs)
-
-        metrics = {
-            'total_throughput': total_throughput,
-            'fairness_index': fairness_index,
-            'jainXtpt': fairness_index * total_throughput,
-            'wlan_throughputs': wlan_throughputs
-        }
-
-        return metrics
-
-    def _extract_wlan_throughputs(self, komondor_result):
-        ssids = komondor_result.wlans()
-        throughputs = {}
-        for ssid in ssids:
-            throughputs[ssid] = {}
-            throughput = komondor_result.wlan_throughput(ssid)
-            throughputs[ssid]['throughput'] = throughput
-            dn_id = self.get_dn_id_by_ssid(ssid)
-            customer_count = self.dn_customer_count(dn_id)
-            total_throughput = komondor_result.wlan_throughput(ssid)
-            throughput_per_customer = (total_throughput / customer_count)
-            customer_throughputs = \
-                [throughput_per_customer for _ in range(0, customer_count)]
-            throughputs[ssid]['customer_throughputs'] = customer_throughputs
-        return throughputs
-
-    def _calculate_jains_fairness_index(self, throughputs=[]):
-        customer_count = len(throughputs)
-        sum_throughputs_squared = pow(sum(throughputs), 2)
-        squared_throughputs = [pow(x, 2) for x in throughputs]
-        sum_squared_throughputs = sum(squared_throughputs)
-        return (sum_throughputs_squared /
-            (customer_count * sum_squared_throughputs))
+    def _check_komondor_store(self):
+        '''
+        Reloads the results and drops all remembered decisions if the
+        Komondor store has been changed by another process, e.g. by a
+        rebuild of the emulator.
+        '''
+        version = self.komondor_store.data_version()
+        if version == self.komondor_store_version:
+            return False
+        self.logger.info('ChannelAssignmentOracle: Komondor store changed. '
+                         'Reloading results.')
+        self.komondor_configs, self.komondor_results = \
+            self._read_komondor_cache()
+        self.komondor_files, self.komondor_wlans, self.wlan_throughputs = \
+            self._build_throughput_matrix()
+        self.decisions.clear()
+        self.komondor_store_version = self.komondor_store.data_version()
+        return True
+
+    def decision_cache_info(self):
+        return {'hits': self.decision_cache_hits,
+                'misses': self.decision_cache_misses,
+                'size': len(self.decisions),
+                'max_size': self.CONF.decision_cache_size}
+
+    def _customer_counts(self):
+        return np.array([self.dn_customer_count(self.get_dn_id_by_ssid(ssid))
+                         for ssid in self.komondor_wlans])
+
+    def _objective_params(self):
+        if self.objective == 'weighted':
+            return {'weights': [float(self.CONF.weights.get(ssid, 1))
+                                for ssid in self.komondor_wlans]}
+        if self.objective == 'alphaFair':
+            return {'alpha': self.CONF.alpha}
+        return {}
 
+    def _compute_oracle_scores(self, customer_counts=None):
+        '''
+        Scores all results at once for customer_counts, by default the
+        current customer distribution. Returns a dict of arrays with one
+        entry per result file.
+        '''
+        if customer_counts is None:
+            customer_counts = self._customer_counts()
+        objective = OBJECTIVES[self.objective]
+        return objective(self.wlan_throughputs, customer_counts,
+                         **self._objective_params())
 
     def get_dn_id_by_ssid(self, ssid):
         for dn_id in self.customer_allocation.keys():
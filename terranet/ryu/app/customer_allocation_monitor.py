@@ -80,22 +80,46 @@ class CustomerAllocationMonitor(app_manager.RyuApp):
     def _customer_flow_added_handler(self, ev):
         self.logger.debug('CustomerAllocationMonitor: Received event '
                           '{}.'.format(ev.__class__.__name__))
-        ipv6 = ev.customer_ipv6
+        self._allocate_customer(ev.customer_ipv6)
+        return self.customer_allocation
+
+    def _allocate_customer(self, ipv6):
+        '''
+        Adds the allocation of customer ipv6. Returns False if the customer
+        is allocated already, e.g. for events of duplicate packet ins.
+        '''
         dn_id = IPv6AddressHelper.distribution_id(ipv6)
         if not self.customer_allocation.get(dn_id):
             self.customer_allocation[dn_id] = {'customers': []}
-        self.customer_allocation[dn_id]['customers'].append(ipv6)
+        customers = self.customer_allocation[dn_id]['customers']
+        if ipv6 in customers:
+            self.logger.debug('CustomerAllocationMonitor: Customer {} is '
+                              'allocated to DN {} already.'
+                              .format(ipv6, dn_id))
+            return False
+        customers.append(ipv6)
         self.logger.info('CustomerAllocationMonitor: Allocation between '
                          'customer {} and DN {} added.'.format(ipv6, dn_id))
-        return self.customer_allocation
+        return True
 
     @set_ev_cls(EventCustomerFlowRemoved)
     def _customer_flow_removed_handler(self, ev):
         self.logger.debug('CustomerAllocationMonitor: Received event '
                           '{}.'.format(ev.__class__.__name__))
-        ipv6 = ev.customer_ipv6
+        self._release_customer(ev.customer_ipv6)
+        return self.customer_allocation
+
+    def _release_customer(self, ipv6):
+        '''
+        Removes the allocation of customer ipv6. Returns False if the
+        customer is not allocated.
+        '''
         dn_id = IPv6AddressHelper.distribution_id(ipv6)
-        self.customer_allocation[dn_id]['customers'].remove(ipv6)
+        customers = self.customer_allocation.get(dn_id, {}).get('customers',
+                                                                [])
+        if ipv6 not in customers:
+            return False
+        customers.remove(ipv6)
         self.logger.info('CustomerAllocationMonitor: Allocation between '
                          'customer {} and DN {} removed.'.format(ipv6, dn_id))
-        return self.customer_allocation
+        return True
@@ -1,16 +1,41 @@
+import os
+import json
+import time
+import collections
+from functools import partial
+
+from ryu import cfg
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.controller.event import EventBase
+from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
-from ryu.lib.packet import ipv6
 
 from .mac_learning_pipeline import MacLearningPipeline
+from .packet_headers import packet_headers
 from .ipv6_address_helper import IPv6AddressHelper
 
 
+opts = (cfg.BoolOpt('proactive', default=False,
+                    help='Install the customer flows of the topology '
+                         'customer inventory when a switch connects '
+                         'instead of on the first customer packet'),
+        cfg.StrOpt('topo', default='HybridVirtualFiberTopo',
+                   help='Topo whose customer inventory is installed'),
+        cfg.StrOpt('customer_inventory', default=None,
+                   help='Customer inventory file, defaults to the '
+                        'inventory written by the topo'),
+        cfg.IntOpt('activity_interval', default=5,
+                   help='Seconds between the flow stats requests counting '
+                        'active customers in proactive mode'),
+        cfg.IntOpt('activity_timeout', default=10,
+                   help='Seconds without traffic after which a customer '
+                        'is considered inactive in proactive mode')
+        )
+cfg.CONF.register_opts(opts, 'customer_flow_pipeline')
+
+
 class EventCustomerFlowAdded(EventBase):
     def __init__(self, customer_ipv6):
         super().__init__()
@@ -40,6 +65,41 @@ class CustomerFlowPipeline(MacLearningPipeline):
     def __init__(self, *args, **kwargs):
         self.customer_table_allocation = {}
         super().__init__(*args, **kwargs)
+        self.pipeline_conf = cfg.CONF['customer_flow_pipeline']
+        self.datapaths = {}
+        # Packet count and time of the last change per customer of the
+        # proactively installed flows
+        self.customer_activity = {}
+        self.active_customers = set()
+        self.customer_inventory = []
+        # Customers whose activity is counted from the flow stats
+        self.inventory_customers = set()
+        # Seconds from packet in to the confirmed installation of the flows
+        # of reactively learned customers
+        self.customer_setup_latencies = collections.deque(maxlen=1000)
+        if self.pipeline_conf.proactive:
+            self.customer_inventory = self._read_customer_inventory()
+            self.inventory_customers = set(self.customer_inventory)
+            self.activity_thread = hub.spawn(self._activity_monitor)
+
+    def _read_customer_inventory(self):
+        path = self.pipeline_conf.customer_inventory
+        if not path:
+            topo_dir = os.path.normpath(
+                os.path.join(os.path.dirname(__file__), '../../topo'))
+            path = os.path.join(topo_dir, '.customers',
+                                '{}.json'.format(self.pipeline_conf.topo))
+        if not os.path.isfile(path):
+            self.logger.warn('CustomerFlowPipeline: No customer inventory '
+                             'found at {}. Learning customers reactively.'
+                             .format(path))
+            return []
+        with open(path) as f:
+            customers = json.load(f)['customers']
+        self.logger.info('CustomerFlowPipeline: Loaded {} customers from {}.'
+                         .format(len(customers), path))
+        return [str(IPv6AddressHelper.parse_address(x['ipv6']))
+                for x in customers]
 
     def _notify_customer_event_flow_added(self, customer_ipv6):
         ev = EventCustomerFlowAdded(customer_ipv6)
@@ -55,14 +115,41 @@ class CustomerFlowPipeline(MacLearningPipeline):
                          'Sent event {} to observers.'
                          .format(ev.__class__.__name__))
 
-    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
-    def switch_features_handler(self, ev):
-        super().switch_features_handler(ev)
-        datapath = ev.msg.datapath
-        self._init_table_zero(datapath)
-        self._init_dn_table(datapath)
-
-    def _init_table_zero(self, datapath):
+    def _init_tables(self, datapath, batch):
+        super()._init_tables(datapath, batch)
+        self._init_table_zero(datapath, batch)
+        self._init_dn_table(datapath, batch)
+        if self.customer_inventory:
+            self.datapaths[datapath.id] = datapath
+            self._install_customer_inventory(datapath, batch)
+
+    def _remove_datapath(self, datapath):
+        super()._remove_datapath(datapath)
+        self.datapaths.pop(datapath.id, None)
+
+    def _install_customer_inventory(self, datapath, batch):
+        '''
+        Installs the DN and customer table entries of all customers of the
+        inventory. The entries do not time out, customer activity is
+        counted from their flow stats.
+        '''
+        subnets = set()
+        addresses = IPv6AddressHelper.decode_many(self.customer_inventory)
+        for customer_ip, address in zip(self.customer_inventory, addresses):
+            subnet_prefix = address.subnet_prefix
+            table_id = self._customer_table_id(datapath, customer_ip, batch)
+            if subnet_prefix not in subnets:
+                subnets.add(subnet_prefix)
+                self._install_distribution_subnet(datapath, subnet_prefix,
+                                                  table_id, batch)
+            self._install_customer_flows(datapath, table_id, customer_ip,
+                                         batch)
+        self.logger.info('CustomerFlowPipeline: Installed flows of {} '
+                         'customers in {} subnets at datapath {}.'
+                         .format(len(self.customer_inventory), len(subnets),
+                                 datapath.id))
+
+    def _init_table_zero(self, datapath, batch):
         ofp_parser = datapath.ofproto_parser
         table_id = 0
 
@@ -77,7 +164,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=dst_match,
                                     instructions=dn_match_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
         src_match = ofp_parser.OFPMatch(
             eth_type=0x86dd,
@@ -86,7 +173,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=src_match,
                                     instructions=dn_match_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
         self.logger.info("CustomerFlowPipeline: Initialized table {}. "
                          "Processing dn subnet match at table {}.".format(
@@ -100,13 +187,13 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=ofp_parser.OFPMatch(),
                                     instructions=table_miss_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("CustomerFlowPipeline: Initialized table {}. "
                          "On table-miss send to table {}.".format(
                              table_id,
                              src_mac_table_id))
 
-    def _init_dn_table(self, datapath):
+    def _init_dn_table(self, datapath, batch):
         ofproto = datapath.ofproto
         ofp_parser = datapath.ofproto_parser
 
@@ -119,14 +206,13 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     priority=0,
                                     match=ofp_parser.OFPMatch(),
                                     instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("CustomerFlowPipeline: Initialized DN table {}. "
                          "On table-miss send to controller.".format(table_id))
 
-    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
-    def _packet_in_handler(self, ev):
+    def _handle_packet_in(self, ev, batch):
         # MAC learning
-        super()._packet_in_handler(ev)
+        super()._handle_packet_in(ev, batch)
         msg = ev.msg
         in_port = msg.match["in_port"]
 
@@ -136,37 +222,51 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                                  table_id))
 
         if table_id == self.__class__.DN_TABLE:
-            self._handle_new_distribution_subnet(ev)
+            self._handle_new_distribution_subnet(ev, batch)
         if (table_id >= self.__class__.FIRST_CUSTOMER_TABLE and
                 table_id < self.__class__.SRC_MAC_TABLE):
-            self._handle_new_customer_address(ev)
+            self._handle_new_customer_address(ev, batch)
 
-    def _handle_new_distribution_subnet(self, ev):
+    def _handle_new_distribution_subnet(self, ev, batch):
         msg = ev.msg
         datapath = msg.datapath
-        ofp_parser = datapath.ofproto_parser
         buffer_id = msg.buffer_id
-        pkt = packet.Packet(msg.data)
-
-        pkt_ipv6 = pkt.get_protocols(ipv6.ipv6)[0]
-        subnet_prefix = IPv6AddressHelper.subnet_prefix(pkt_ipv6.src)
-        subnet_id = IPv6AddressHelper.subnet_id(pkt_ipv6.src)
-        dn_id = IPv6AddressHelper.distribution_id(pkt_ipv6.src)
-        cn_id = IPv6AddressHelper.client_id(pkt_ipv6.src)
+        ipv6_src = packet_headers(msg).ipv6_src
+        if ipv6_src is None:
+            self.logger.info("CustomerFlowPipeline: Ignoring non IPv6 "
+                             "packet in from table {}.".format(msg.table_id))
+            return
+
+        subnet_prefix = IPv6AddressHelper.subnet_prefix(ipv6_src)
+        if not self._learning(datapath, msg.table_id, subnet_prefix):
+            return
+        subnet_id = IPv6AddressHelper.subnet_id(ipv6_src)
+        dn_id = IPv6AddressHelper.distribution_id(ipv6_src)
+        cn_id = IPv6AddressHelper.client_id(ipv6_src)
         self.logger.info("CustomerFlowPipeline: Distribution/ Client network "
                          "detected. IPv6: {}, "
                          "Subnet prefix: {}, "
                          "Subnet id: {}, "
                          "Distibution node id: {}, "
-                         "Client node id: {}.".format(pkt_ipv6,
+                         "Client node id: {}.".format(ipv6_src,
                                                       subnet_prefix,
                                                       subnet_id,
                                                       dn_id,
                                                       cn_id))
 
+        dn_table_id = self._get_customer_table_id(ev, batch)
+        self._install_distribution_subnet(datapath, subnet_prefix,
+                                          dn_table_id, batch,
+                                          buffer_id=buffer_id)
+
+    def _install_distribution_subnet(self, datapath, subnet_prefix,
+                                     dn_table_id, batch, buffer_id=None):
+        ofp_parser = datapath.ofproto_parser
+        if buffer_id is None:
+            buffer_id = datapath.ofproto.OFP_NO_BUFFER
+
         # Process traffic to/ from customers at customer table
         table_id = self.__class__.DN_TABLE
-        dn_table_id = self._get_customer_table_id(ev)
         customer_inst = [ofp_parser.OFPInstructionGotoTable(dn_table_id)]
 
         dst_customer_match = ofp_parser.OFPMatch(
@@ -178,7 +278,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=dst_customer_match,
                                     instructions=customer_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
         src_customer_match = ofp_parser.OFPMatch(
             eth_type=0x86dd,
@@ -189,7 +289,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=src_customer_match,
                                     instructions=customer_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
         # Process other traffic from subnet at MAC learning table
         src_mac_table_id = self.__class__.SRC_MAC_TABLE
@@ -204,7 +304,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=dst_client_net_match,
                                     instructions=client_net_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
         src_client_net_match = ofp_parser.OFPMatch(
             eth_type=0x86dd,
@@ -216,16 +316,17 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     table_id=table_id,
                                     match=src_client_net_match,
                                     instructions=client_net_inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
 
-    def _get_customer_table_id(self, ev):
+    def _get_customer_table_id(self, ev, batch):
         msg = ev.msg
         datapath = msg.datapath
-        pkt = packet.Packet(msg.data)
+        ipv6_src = packet_headers(msg).ipv6_src
+        return self._customer_table_id(datapath, ipv6_src, batch)
 
-        pkt_ipv6 = pkt.get_protocols(ipv6.ipv6)[0]
-        dn_id = IPv6AddressHelper.distribution_id(pkt_ipv6.src)
-        distribution_net = IPv6AddressHelper.distribution_net(pkt_ipv6.src)
+    def _customer_table_id(self, datapath, ip, batch):
+        dn_id = IPv6AddressHelper.distribution_id(ip)
+        distribution_net = IPv6AddressHelper.distribution_net(ip)
 
         if not self.customer_table_allocation.get(dn_id):
             table_id = self.__class__.NEXT_TABLE
@@ -234,7 +335,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
                 dn_entry = self.customer_table_allocation[dn_id]
                 dn_entry["distribution_net"] = distribution_net
             self.__class__.NEXT_TABLE += 1
-            self._init_customer_table(datapath, table_id)
+            self._init_customer_table(datapath, table_id, batch)
 
             self.logger.info("CustomerFlowPipeline: "
                              "No table allocated for DN yet. "
@@ -242,7 +343,7 @@ class CustomerFlowPipeline(MacLearningPipeline):
 
         return self.customer_table_allocation[dn_id]["table_id"]
 
-    def _init_customer_table(self, datapath, table_id):
+    def _init_customer_table(self, datapath, table_id, batch):
         ofproto = datapath.ofproto
         ofp_parser = datapath.ofproto_parser
 
@@ -254,60 +355,89 @@ class CustomerFlowPipeline(MacLearningPipeline):
                                     priority=0,
                                     match=ofp_parser.OFPMatch(),
                                     instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("CustomerFlowPipeline: Initialized table {}. "
                          "On table-miss send to controller.".format(table_id))
 
-    def _handle_new_customer_address(self, ev):
+    def _handle_new_customer_address(self, ev, batch):
         msg = ev.msg
         table_id = msg.table_id
         datapath = msg.datapath
-        ofp = datapath.ofproto
-        ofp_parser = datapath.ofproto_parser
         buffer_id = msg.buffer_id
-        pkt = packet.Packet(msg.data)
-        pkt_ipv6 = pkt.get_protocols(ipv6.ipv6)[0]
+        headers = packet_headers(msg)
         idle_timeout = self.__class__.CUSTOMER_FLOW_IDLE_TIMEOUT
-
-        src_mac_table_id = self.__class__.SRC_MAC_TABLE
-        inst = [ofp_parser.OFPInstructionGotoTable(src_mac_table_id)]
+        if headers.ipv6_src is None:
+            self.logger.info("CustomerFlowPipeline: Ignoring non IPv6 "
+                             "packet in from table {}.".format(table_id))
+            return
 
         customer_ips = []
-        if IPv6AddressHelper.is_customer_address(pkt_ipv6.src):
-            customer_ips.append(pkt_ipv6.src)
-        if IPv6AddressHelper.is_customer_address(pkt_ipv6.dst):
-            customer_ips.append(pkt_ipv6.dst)
+        duplicate = False
+        for ip in (headers.ipv6_src, headers.ipv6_dst):
+            # Customers with flows in flight are skipped before parsing
+            if (datapath.id, table_id, ip) in self.pending_learning:
+                duplicate = True
+            elif IPv6AddressHelper.is_customer_address(ip):
+                customer_ips.append(ip)
         if not customer_ips:
+            if duplicate:
+                self.logger.debug("CustomerFlowPipeline: Dropped duplicate "
+                                  "packet in from table {}.".format(table_id))
+                return
             raise RuntimeError("CustomerFlowPipeline: Packet does not include "
                                "customer ipv6 address.")
 
         for customer_ip in customer_ips:
-            dst_match = ofp_parser.OFPMatch(
-                eth_type=0x86dd,
-                ipv6_dst=customer_ip)
-            mod = ofp_parser.OFPFlowMod(datapath=datapath,
-                                        table_id=table_id,
-                                        match=dst_match,
-                                        idle_timeout=idle_timeout,
-                                        instructions=inst,
-                                        flags=ofp.OFPFF_SEND_FLOW_REM)
-            datapath.send_msg(mod)
+            if not self._learning(datapath, table_id, customer_ip):
+                continue
+            self._install_customer_flows(datapath, table_id, customer_ip,
+                                         batch,
+                                         idle_timeout=idle_timeout,
+                                         buffer_id=buffer_id)
+            # Observers are notified once the switch confirmed the flows
+            batch.on_installed(partial(self._customer_flows_installed,
+                                       customer_ip, table_id))
+
+    def _customer_flows_installed(self, customer_ip, table_id, latency):
+        self.customer_setup_latencies.append(latency)
+        self.logger.info("CustomerFlowPipeline: "
+                         "New customer: {} "
+                         "added to table {} after {:.1f} ms."
+                         .format(customer_ip, table_id, latency * 1000))
+        self._notify_customer_event_flow_added(customer_ip)
+
+    def _install_customer_flows(self, datapath, table_id, customer_ip,
+                                batch, idle_timeout=0, buffer_id=None):
+        ofp = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+        if buffer_id is None:
+            buffer_id = ofp.OFP_NO_BUFFER
+        # Only reactively learned customers time out
+        flags = ofp.OFPFF_SEND_FLOW_REM if idle_timeout else 0
 
-            src_match = ofp_parser.OFPMatch(
-                eth_type=0x86dd,
-                ipv6_src=customer_ip)
-            mod = ofp_parser.OFPFlowMod(datapath=datapath,
-                                        buffer_id=buffer_id,
-                                        table_id=table_id,
-                                        match=src_match,
-                                        instructions=inst)
-            datapath.send_msg(mod)
+        src_mac_table_id = self.__class__.SRC_MAC_TABLE
+        inst = [ofp_parser.OFPInstructionGotoTable(src_mac_table_id)]
 
-            self._notify_customer_event_flow_added(customer_ip)
-            self.logger.info("CustomerFlowPipeline: "
-                             "New customer: {} "
-                             "added to table {}".format(pkt_ipv6,
-                                                        table_id))
+        dst_match = ofp_parser.OFPMatch(
+            eth_type=0x86dd,
+            ipv6_dst=customer_ip)
+        mod = ofp_parser.OFPFlowMod(datapath=datapath,
+                                    table_id=table_id,
+                                    match=dst_match,
+                                    idle_timeout=idle_timeout,
+                                    instructions=inst,
+                                    flags=flags)
+        batch.add(mod)
+
+        src_match = ofp_parser.OFPMatch(
+            eth_type=0x86dd,
+            ipv6_src=customer_ip)
+        mod = ofp_parser.OFPFlowMod(datapath=datapath,
+                                    buffer_id=buffer_id,
+                                    table_id=table_id,
+                                    match=src_match,
+                                    instructions=inst)
+        batch.add(mod)
 
     @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
     def _flow_removed_handler(self, ev):
@@ -335,6 +465,8 @@ class CustomerFlowPipeline(MacLearningPipeline):
                          .format(table_id, reason))
 
         if ipv6_dst:
+            # Learn the customer again on its next packet
+            self.pending_learning.discard((datapath.id, table_id, ipv6_dst))
             src_match = ofp_parser.OFPMatch(
                 eth_type=0x86dd,
                 ipv6_src=ipv6_dst)
@@ -348,3 +480,64 @@ class CustomerFlowPipeline(MacLearningPipeline):
                              'Removed match for ipv6_src.'
                              .format(ipv6_dst, table_id))
         self._notify_customer_event_flow_removed(ipv6_dst)
+
+    def _activity_monitor(self):
+        while True:
+            for datapath in list(self.datapaths.values()):
+                self._request_customer_flow_stats(datapath)
+            hub.sleep(self.pipeline_conf.activity_interval)
+            self._expire_inactive_customers()
+
+    def _request_customer_flow_stats(self, datapath):
+        ofp_parser = datapath.ofproto_parser
+        for dn_entry in self.customer_table_allocation.values():
+            datapath.send_msg(ofp_parser.OFPFlowStatsRequest(
+                datapath, table_id=dn_entry["table_id"]))
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _customer_flow_stats_reply_handler(self, ev):
+        if not self.customer_inventory:
+            return
+        now = time.monotonic()
+        datapath_id = ev.msg.datapath.id
+        for stat in ev.msg.body:
+            if not (self.__class__.FIRST_CUSTOMER_TABLE <= stat.table_id <
+                    self.__class__.SRC_MAC_TABLE):
+                continue
+            for field in ('ipv6_src', 'ipv6_dst'):
+                customer_ip = stat.match.get(field)
+                # Skip the masked subnet matches
+                if not isinstance(customer_ip, str):
+                    continue
+                customer_ip = str(IPv6AddressHelper.parse_address(
+                    customer_ip))
+                # Reactively learned customers are reported on packet in
+                # and flow removal
+                if customer_ip not in self.inventory_customers:
+                    continue
+                key = (datapath_id, customer_ip, field)
+                last_count, _ = self.customer_activity.get(key, (0, None))
+                if stat.packet_count > last_count:
+                    self.customer_activity[key] = (stat.packet_count, now)
+                    self._customer_active(customer_ip)
+
+    def _customer_active(self, customer_ip):
+        if customer_ip in self.active_customers:
+            return
+        self.active_customers.add(customer_ip)
+        self._notify_customer_event_flow_added(customer_ip)
+
+    def _expire_inactive_customers(self):
+        '''
+        Customers without new packets for activity_timeout seconds are
+        inactive, like reactively learned customers whose flows time out.
+        '''
+        now = time.monotonic()
+        last_seen = {}
+        for (_, customer_ip, _), (_, seen) in self.customer_activity.items():
+            last_seen[customer_ip] = max(seen, last_seen.get(customer_ip, 0))
+        for customer_ip in list(self.active_customers):
+            if now - last_seen[customer_ip] > \
+                    self.pipeline_conf.activity_timeout:
+                self.active_customers.discard(customer_ip)
+                self._notify_customer_event_flow_removed(customer_ip)
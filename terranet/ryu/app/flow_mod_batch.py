@@ -0,0 +1,46 @@
+class FlowModBatch(object):
+    """OpenFlow messages to a datapath sent in a single write.
+
+    The messages are serialized into one buffer followed by a barrier
+    request. The barrier reply confirms that the switch has processed all
+    messages of the batch, callbacks registered with on_installed are then
+    called with the latency of the batch.
+    """
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.msgs = []
+        self.callbacks = []
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def add(self, msg):
+        self.msgs.append(msg)
+        return msg
+
+    def on_installed(self, callback):
+        self.callbacks.append(callback)
+
+    def send(self, barrier=True):
+        '''
+        Sends all messages and returns the xid of the barrier request or
+        None if nothing was sent.
+        '''
+        datapath = self.datapath
+        msgs = self.msgs
+        self.msgs = []
+        if not msgs:
+            return None
+        xid = None
+        if barrier:
+            msgs.append(datapath.ofproto_parser.OFPBarrierRequest(datapath))
+        buf = bytearray()
+        for msg in msgs:
+            if msg.xid is None:
+                datapath.set_xid(msg)
+            msg.serialize()
+            buf += msg.buf
+            xid = msg.xid
+        if not datapath.send(bytes(buf)):
+            return None
+        return xid if barrier else None
@@ -1,66 +1,117 @@
+import socket
 import ipaddress
+import collections
+from functools import lru_cache
+
+
+# Distinct addresses whose fields are kept, e.g. all customers of a topology
+DECODE_CACHE_SIZE = 16384
+
+SUBNET_MASK = ((1 << 64) - 1) << 64
+DISTRIBUTION_MASK = ((1 << 56) - 1) << 72
+CUSTOMER_BIT = 1 << 63
+
+IPv6AddressFields = collections.namedtuple(
+    'IPv6AddressFields',
+    ['value', 'prefix', 'subnet_id', 'subnet_prefix', 'interface_id',
+     'distribution_id', 'client_id', 'is_customer'])
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def _decode(ip):
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except (OSError, ValueError):
+        # Raises AddressValueError for invalid addresses
+        address = ipaddress.IPv6Address(ip)
+        if getattr(address, 'scope_id', None) is not None:
+            raise ipaddress.AddressValueError(
+                "Scoped address {!r} has no fields".format(ip))
+        value = int(address)
+    subnet = (value >> 64) & 0xffff
+    # Exploded address without colons
+    digits = "{:032x}".format(value)
+    subnet_prefix = "{}:{}:{}:{}".format(digits[0:4], digits[4:8],
+                                         digits[8:12], digits[12:16])
+    return IPv6AddressFields(
+        value=value,
+        prefix=subnet_prefix[:14],
+        subnet_id=digits[12:16],
+        subnet_prefix=subnet_prefix,
+        interface_id="{}:{}:{}:{}".format(digits[16:20], digits[20:24],
+                                          digits[24:28], digits[28:32]),
+        distribution_id=(subnet >> 8) - 0x80,
+        client_id=subnet & 0xff,
+        is_customer=bool(value & CUSTOMER_BIT))
 
 
 class IPv6AddressHelper:
+    @classmethod
+    def decode(cls, ip):
+        '''
+        Returns the IPv6AddressFields of ip. Addresses are parsed once, the
+        fields are cached for the DECODE_CACHE_SIZE last used addresses.
+        '''
+        return _decode(str(ip))
+
+    @classmethod
+    def decode_many(cls, ips):
+        '''
+        Returns the IPv6AddressFields of every address of ips, parsing
+        each distinct address once.
+        '''
+        ips = [str(ip) for ip in ips]
+        fields = {ip: _decode(ip) for ip in set(ips)}
+        return [fields[ip] for ip in ips]
+
     @classmethod
     def parse_address(cls, ip):
-        return ipaddress.IPv6Address(str(ip))
+        ip = str(ip)
+        if '%' in ip:
+            # Keeps the scope id of link-local addresses
+            return ipaddress.IPv6Address(ip)
+        return ipaddress.IPv6Address(cls.decode(ip).value)
 
     @classmethod
     def prefix(cls, ip):
-        ip_parts = cls.parse_address(ip).exploded.split(":")
-        return "{}:{}:{}".format(ip_parts[0], ip_parts[1], ip_parts[2])
+        return cls.decode(ip).prefix
 
     @classmethod
     def subnet_id(cls, ip):
-        ip_parts = cls.parse_address(ip).exploded.split(":")
-        return ip_parts[3]
+        return cls.decode(ip).subnet_id
 
     @classmethod
     def subnet_prefix(cls, ip):
-        return "{}:{}".format(cls.prefix(ip), cls.subnet_id(ip))
+        return cls.decode(ip).subnet_prefix
 
     @classmethod
     def interface_id(cls, ip):
-        ip_parts = cls.parse_address(ip).exploded.split(":")
-        return "{}:{}:{}:{}".format(ip_parts[4], ip_parts[5], ip_parts[6],
-                                    ip_parts[7])
+        return cls.decode(ip).interface_id
 
     @classmethod
     def distribution_id(cls, ip):
-        subnet_id = cls.subnet_id(ip)
-        distribution_id = int("0x{}".format(subnet_id[:2]), 16) - 0x80
-        return distribution_id
+        return cls.decode(ip).distribution_id
 
     @classmethod
     def client_id(cls, ip):
-        subnet_id = cls.subnet_id(ip)
-        client_id = int("0x{}".format(subnet_id[2:]), 16)
-        return client_id
+        return cls.decode(ip).client_id
 
     @classmethod
     def distribution_net(cls, ip):
-        prefix = cls.prefix(ip)
-        distribution_id = cls.distribution_id(ip)
-        distribution_subnet = distribution_id + 0x80
-        return ipaddress.ip_network(
-                u"{}:{:x}00::0/56".format(prefix,
-                                          distribution_subnet))
+        value = cls.decode(ip).value
+        return ipaddress.IPv6Network((value & DISTRIBUTION_MASK, 56))
 
     @classmethod
     def client_net(cls, ip):
-        subnet_prefix = cls.subnet_prefix(ip)
-        return ipaddress.ip_network(u"{}::/64".format(subnet_prefix))
+        value = cls.decode(ip).value
+        return ipaddress.IPv6Network((value & SUBNET_MASK, 64))
 
     @classmethod
     def customer_net(cls, ip):
-        subnet_prefix = cls.subnet_prefix(ip)
-        return ipaddress.ip_network(u"{}:8000::/65".format(subnet_prefix))
+        value = cls.decode(ip).value
+        return ipaddress.IPv6Network(((value & SUBNET_MASK) | CUSTOMER_BIT,
+                                      65))
 
     @classmethod
     def is_customer_address(cls, ip):
-        subnet_prefix = cls.subnet_prefix(ip)
-        customer_net = cls.customer_net(ip)
-        if cls.parse_address(ip) in customer_net:
-            return True
-        return False
+        return cls.decode(ip).is_customer
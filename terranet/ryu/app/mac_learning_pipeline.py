@@ -1,25 +1,106 @@
+import time
+import collections
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, \
+    DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
-from ryu.lib.packet import ipv6
+
+from .flow_mod_batch import FlowModBatch
+from .packet_headers import packet_headers
+from .pending_learning import PendingLearningTable
+from .token_bucket import TokenBucket
 
 
 class MacLearningPipeline(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
     SRC_MAC_TABLE = 0
     DST_MAC_TABLE = 1
+    # Packet ins processed per second and datapath
+    PACKET_IN_RATE = 500
+    PACKET_IN_BURST = 100
+    # Seconds duplicate packet ins of a learned address are dropped for
+    PENDING_LEARNING_TTL = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Start time and callbacks of the sent batches by (datapath id,
+        # barrier xid)
+        self.pending_batches = {}
+        self.batch_latencies = collections.deque(maxlen=1000)
+        # (datapath id, table id, address) of the recently learned
+        # addresses
+        self.pending_learning = PendingLearningTable(
+            self.__class__.PENDING_LEARNING_TTL)
+        self.packet_in_buckets = {}
+        self.dropped_packet_ins = collections.Counter()
+
+    def _send_batch(self, batch, start=None):
+        '''
+        Sends batch and tracks its installation. start defaults to now, the
+        latency reported to the callbacks of the batch is measured from it.
+        '''
+        if start is None:
+            start = time.monotonic()
+        datapath = batch.datapath
+        callbacks = batch.callbacks
+        count = len(batch)
+        xid = batch.send()
+        if xid is not None:
+            self.pending_batches[(datapath.id, xid)] = (start, count,
+                                                        callbacks)
+        return xid
+
+    # The reply to the batch of switch_features_handler may arrive before
+    # the datapath is in MAIN_DISPATCHER
+    @set_ev_cls(ofp_event.EventOFPBarrierReply,
+                [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        datapath = ev.msg.datapath
+        pending = self.pending_batches.pop((datapath.id, ev.msg.xid), None)
+        if not pending:
+            return
+        (start, count, callbacks) = pending
+        latency = time.monotonic() - start
+        self.batch_latencies.append(latency)
+        self.logger.debug("MacLearningPipeline: {} messages installed at "
+                          "datapath {} after {:.1f} ms."
+                          .format(count, datapath.id, latency * 1000))
+        for callback in callbacks:
+            callback(latency)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if datapath.id is None:
+            return
+        self._remove_datapath(datapath)
+
+    def _remove_datapath(self, datapath):
+        '''
+        Drops the state of a disconnected datapath, its pending batches
+        are never confirmed.
+        '''
+        for key in [x for x in self.pending_batches if x[0] == datapath.id]:
+            del self.pending_batches[key]
+        self.packet_in_buckets.pop(datapath.id, None)
+        self.logger.info("MacLearningPipeline: Datapath {} disconnected."
+                         .format(datapath.id))
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
-        self._init_src_mac_table(datapath)
-        self._init_dst_mac_table(datapath)
+        batch = FlowModBatch(datapath)
+        self._init_tables(datapath, batch)
+        self._send_batch(batch)
+
+    def _init_tables(self, datapath, batch):
+        self._init_src_mac_table(datapath, batch)
+        self._init_dst_mac_table(datapath, batch)
 
-    def _init_src_mac_table(self, datapath):
+    def _init_src_mac_table(self, datapath, batch):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -32,11 +113,11 @@ class MacLearningPipeline(app_manager.RyuApp):
                                 priority=0,
                                 match=parser.OFPMatch(),
                                 instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("MacLearningPipeline: Initialized src MAC table {}. "
                          "On table-miss send to controller.".format(table_id))
 
-    def _init_dst_mac_table(self, datapath):
+    def _init_dst_mac_table(self, datapath, batch):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -49,12 +130,46 @@ class MacLearningPipeline(app_manager.RyuApp):
                                 priority=0,
                                 match=parser.OFPMatch(),
                                 instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("MacLearningPipeline: Initialized dst MAC table {}. "
                          "On table-miss flood.".format(table_id))
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        start = time.monotonic()
+        datapath = ev.msg.datapath
+        if not self._packet_in_allowed(datapath, start):
+            return
+        batch = FlowModBatch(datapath)
+        self._handle_packet_in(ev, batch)
+        self._send_batch(batch, start=start)
+
+    def _packet_in_allowed(self, datapath, now):
+        bucket = self.packet_in_buckets.get(datapath.id)
+        if bucket is None:
+            bucket = TokenBucket(self.__class__.PACKET_IN_RATE,
+                                 self.__class__.PACKET_IN_BURST)
+            self.packet_in_buckets[datapath.id] = bucket
+        if bucket.consume(now=now):
+            return True
+        self.dropped_packet_ins[datapath.id] += 1
+        self.logger.debug("MacLearningPipeline: Packet in rate of datapath "
+                          "{} exceeded. Dropped packet in."
+                          .format(datapath.id))
+        return False
+
+    def _learning(self, datapath, table_id, address):
+        '''
+        Marks address as learned at table_id. Returns False if its flows
+        have been sent within the last PENDING_LEARNING_TTL seconds.
+        '''
+        if self.pending_learning.add((datapath.id, table_id, address)):
+            return True
+        self.logger.debug("MacLearningPipeline: Dropped duplicate packet in "
+                          "of {} from table {}.".format(address, table_id))
+        return False
+
+    def _handle_packet_in(self, ev, batch):
         msg = ev.msg
         in_port = msg.match['in_port']
         table_id = msg.table_id
@@ -63,24 +178,30 @@ class MacLearningPipeline(app_manager.RyuApp):
                                                  table_id))
 
         if table_id == self.__class__.SRC_MAC_TABLE:
-            self._handle_new_src_mac(ev)
+            self._handle_new_src_mac(ev, batch)
 
-    def _handle_new_src_mac(self, ev):
+    def _handle_new_src_mac(self, ev, batch):
         msg = ev.msg
         datapath = msg.datapath
-        parser = datapath.ofproto_parser
         buffer_id = msg.buffer_id
         in_port = msg.match['in_port']
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        eth_src = packet_headers(msg).eth_src
+        if eth_src is None:
+            self.logger.info("MacLearningPipeline: Packet in without "
+                             "ethernet header at port {}.".format(in_port))
+            return
+        if not self._learning(datapath, self.__class__.SRC_MAC_TABLE,
+                              eth_src):
+            return
         self.logger.info("MacLearningPipeline: New src MAC {} "
-                         "at port {}.".format(eth.src,
+                         "at port {}.".format(eth_src,
                                               in_port))
 
-        self._add_flow_mod_mac_dst(datapath, eth.src, in_port)
-        self._add_flow_mod_mac_src(datapath, eth.src, in_port, buffer_id)
+        self._add_flow_mod_mac_dst(datapath, eth_src, in_port, batch)
+        self._add_flow_mod_mac_src(datapath, eth_src, in_port, buffer_id,
+                                   batch)
 
-    def _add_flow_mod_mac_dst(self, datapath, eth_dst, out_port):
+    def _add_flow_mod_mac_dst(self, datapath, eth_dst, out_port, batch):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         table_id = self.__class__.DST_MAC_TABLE
@@ -92,7 +213,7 @@ class MacLearningPipeline(app_manager.RyuApp):
                                 table_id=table_id,
                                 match=match,
                                 instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("MacLearningPipeline: "
                          "Sending packets with dst MAC {} "
                          "out at port {}. "
@@ -100,7 +221,8 @@ class MacLearningPipeline(app_manager.RyuApp):
                                                               out_port,
                                                               table_id))
 
-    def _add_flow_mod_mac_src(self, datapath, eth_src, in_port, buffer_id):
+    def _add_flow_mod_mac_src(self, datapath, eth_src, in_port, buffer_id,
+                              batch):
         parser = datapath.ofproto_parser
         table_id = self.__class__.SRC_MAC_TABLE
         match = parser.OFPMatch(in_port=in_port,
@@ -112,7 +234,7 @@ class MacLearningPipeline(app_manager.RyuApp):
                                 buffer_id=buffer_id,
                                 match=match,
                                 instructions=inst)
-        datapath.send_msg(mod)
+        batch.add(mod)
         self.logger.info("MacLearningPipeline: Process packets from port {} "
                          "with src MAC {} "
                          "at table {}. "
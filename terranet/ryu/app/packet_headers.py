@@ -0,0 +1,55 @@
+import socket
+
+
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_8021AD = 0x88a8
+ETH_TYPE_IPV6 = 0x86dd
+
+
+class PacketHeaders(object):
+    """Ethernet and IPv6 addresses of a packet in.
+
+    Reads the few header fields the pipelines need at their fixed offsets
+    from a memoryview of the packet data instead of decoding the whole
+    packet with ryu's packet.Packet. Addresses are formatted like ryu
+    formats them. Fields of missing headers are None.
+    """
+    __slots__ = ("eth_dst", "eth_src", "eth_type", "ipv6_src", "ipv6_dst")
+
+    def __init__(self, data):
+        view = memoryview(data)
+        self.eth_dst = None
+        self.eth_src = None
+        self.eth_type = None
+        self.ipv6_src = None
+        self.ipv6_dst = None
+        if len(view) < 14:
+            return
+        self.eth_dst = view[0:6].hex(':')
+        self.eth_src = view[6:12].hex(':')
+        offset = 12
+        eth_type = int.from_bytes(view[offset:offset + 2], 'big')
+        # Skip VLAN tags
+        while (eth_type in (ETH_TYPE_8021Q, ETH_TYPE_8021AD) and
+               len(view) >= offset + 6):
+            offset += 4
+            eth_type = int.from_bytes(view[offset:offset + 2], 'big')
+        self.eth_type = eth_type
+        ip_offset = offset + 2
+        if eth_type == ETH_TYPE_IPV6 and len(view) >= ip_offset + 40:
+            self.ipv6_src = socket.inet_ntop(
+                socket.AF_INET6, view[ip_offset + 8:ip_offset + 24])
+            self.ipv6_dst = socket.inet_ntop(
+                socket.AF_INET6, view[ip_offset + 24:ip_offset + 40])
+
+
+def packet_headers(msg):
+    '''
+    Returns the PacketHeaders of the packet in msg. The headers are parsed
+    once per message and shared by all handlers of the message.
+    '''
+    headers = getattr(msg, '_packet_headers', None)
+    if headers is None:
+        headers = PacketHeaders(msg.data)
+        msg._packet_headers = headers
+    return headers
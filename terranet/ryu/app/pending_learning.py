@@ -0,0 +1,49 @@
+import time
+import collections
+
+
+class PendingLearningTable(object):
+    """Addresses whose flows have been sent to a switch recently.
+
+    Until the flows are installed every further packet of a new address
+    reaches the controller as packet in. Keys are added with a fixed TTL,
+    add returns False for keys that are still pending, so the handlers can
+    drop these duplicates before building any FlowMod. As all keys share
+    the TTL, the oldest keys come first and expired keys are purged from
+    the front.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.expiries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.expiries)
+
+    def __contains__(self, key):
+        expiry = self.expiries.get(key)
+        return expiry is not None and expiry > time.monotonic()
+
+    def add(self, key, now=None):
+        '''
+        Marks key as pending. Returns False if key is pending already.
+        '''
+        if now is None:
+            now = time.monotonic()
+        self.purge(now)
+        if key in self.expiries:
+            return False
+        self.expiries[key] = now + self.ttl
+        return True
+
+    def discard(self, key):
+        self.expiries.pop(key, None)
+
+    def purge(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        expiries = self.expiries
+        while expiries:
+            key, expiry = next(iter(expiries.items()))
+            if expiry > now:
+                break
+            del expiries[key]
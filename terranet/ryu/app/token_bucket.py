@@ -0,0 +1,24 @@
+import time
+
+
+class TokenBucket(object):
+    """Limits events to rate per second with bursts of up to burst."""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def consume(self, tokens=1, now=None):
+        '''
+        Takes tokens from the bucket. Returns False if there are not enough.
+        '''
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
@@ -1,4 +1,5 @@
 import os
+import json
 import uuid
 import itertools
 from ipaddress import IPv4Network, IPv6Network
@@ -25,6 +26,8 @@ class Terratopo(IPTopo):
         if not komondor_system_config:
             self.komondor_system_config = KomondorSystemConfig()
         self.create_komondor_dirs = create_komondor_dirs
+        # Customer flows by CPE name, see customer_inventory()
+        self.customer_flows = {}
         super().__init__(*args, **kwargs)
 
     def build(self, *args, **kwargs):
@@ -32,6 +35,31 @@ class Terratopo(IPTopo):
             self._create_komondor_dirs()
 
         super().build(*args, **kwargs)
+        if self.customer_flows:
+            self.write_customer_inventory()
+
+    @classmethod
+    def customer_inventory_file(cls, topo_name=None):
+        topo_dir = os.path.dirname(os.path.abspath(__file__))
+        if not topo_name:
+            topo_name = cls.__name__
+        return os.path.join(topo_dir, '.customers',
+                            '{}.json'.format(topo_name))
+
+    def customer_inventory(self):
+        '''
+        Returns the customer prefixes of the topology, so controllers can
+        install customer flows before the first customer packet.
+        '''
+        return [self.customer_flows[name]
+                for name in sorted(self.customer_flows)]
+
+    def write_customer_inventory(self):
+        path = self.customer_inventory_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'customers': self.customer_inventory()}, f, indent=2)
+        return path
 
 
     def komondor_config_dir(self):
@@ -173,6 +201,11 @@ class Terratopo(IPTopo):
         (cn_ip, cpe_ip) = self._get_ip(network)
         link[cn].addParams(ip=cn_ip)
         link[cpe].addParams(ip=cpe_ip)
+        self.customer_flows[cpe_name] = {
+            'name': cpe_name,
+            'prefix': str(IPv6Network(network[1])),
+            'ipv6': cpe_ip[1].split('/')[0]
+        }
 
         server = self.add_iperf_server(server_name,
                                        autostart=True)
@@ -330,24 +330,84 @@ class Channel:
                            "max_channel_allowed": 43,
                            "central_freq":         5.865}}}
 
+    __slots__ = ("num", "f0", "width", "komondor_channel_params",
+                 "basic_channels")
+
+    # Reverse index of channel_map: (min_channel_allowed,
+    # max_channel_allowed) of Komondor to the channel number
+    channel_nums = {(v["komondor"]["min_channel_allowed"],
+                     v["komondor"]["max_channel_allowed"]): ch
+                    for ch, v in channel_map.items()}
+
+    # Interned instances by channel number
+    _instances = {}
+
     @classmethod
     def channel_num(cls, min_channel_allowed, max_channel_allowed):
-        for ch, val in cls.channel_map.items():
-            k_conf = val['komondor']
-            if k_conf['min_channel_allowed'] == int(min_channel_allowed) and \
-               k_conf['max_channel_allowed'] == int(max_channel_allowed):
-                   return ch
-        return None
+        return cls.channel_nums.get((int(min_channel_allowed),
+                                     int(max_channel_allowed)))
 
-    def __init__(self, channel_num):
-        self.num = channel_num
-        channel_dict = Channel.channel_map[channel_num]
-        self.f0 = channel_dict["f0"]
-        self.width = channel_dict["width"]
-        self.komondor_channel_params = channel_dict["komondor"]
+    def __new__(cls, channel_num):
+        channel = cls._instances.get(channel_num)
+        if channel is None:
+            channel_dict = cls.channel_map[channel_num]
+            channel = super().__new__(cls)
+            channel.num = channel_num
+            channel.f0 = channel_dict["f0"]
+            channel.width = channel_dict["width"]
+            channel.komondor_channel_params = channel_dict["komondor"]
+            k_conf = channel.komondor_channel_params
+            channel.basic_channels = frozenset(
+                range(k_conf["min_channel_allowed"],
+                      k_conf["max_channel_allowed"] + 1))
+            cls._instances[channel_num] = channel
+        return channel
+
+    def __reduce__(self):
+        return (self.__class__, (self.num,))
 
     def __eq__(self, other):
+        if not isinstance(other, Channel):
+            return NotImplemented
         return self.num == other.num
 
     def __lt__(self, other):
         return self.num < other.num
+
+    def __hash__(self):
+        return hash(self.num)
+
+    def __repr__(self):
+        return "Channel({})".format(self.num)
+
+    def overlaps(self, other):
+        '''
+        True if both channels share a basic Komondor channel.
+        '''
+        return other.num in CHANNEL_OVERLAPS[self.num]
+
+    def is_adjacent(self, other):
+        '''
+        True if the channels do not overlap but other starts right above or
+        ends right below this channel.
+        '''
+        return other.num in CHANNEL_ADJACENCIES[self.num]
+
+
+def _channel_relations():
+    basic_channels = {ch: Channel(ch).basic_channels
+                      for ch in Channel.channel_map}
+    overlaps = {}
+    adjacencies = {}
+    for ch, basic in basic_channels.items():
+        neighbours = {min(basic) - 1, max(basic) + 1}
+        overlaps[ch] = frozenset(x for x, other in basic_channels.items()
+                                 if basic & other)
+        adjacencies[ch] = frozenset(x for x, other in basic_channels.items()
+                                    if not basic & other and
+                                    neighbours & other)
+    return (overlaps, adjacencies)
+
+
+# Channel numbers overlapping and adjacent to each channel number
+CHANNEL_OVERLAPS, CHANNEL_ADJACENCIES = _channel_relations()
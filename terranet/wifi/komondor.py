@@ -1,20 +1,151 @@
 import sys
 import os
+import queue
+import threading
 import subprocess
+import concurrent.futures
 from whichcraft import which
 
 
 def run_komondor_worker(cfg_file,
                         output_dir=None,
                         komondor_executable=None,
-                        komondor_args={}):
+                        komondor_args={},
+                        komondor=None):
+    '''
+    Simulates cfg_file and returns a tuple (cfg_file, error). The result is
+    written to a temporary file first and moved into output_dir on success,
+    so an interrupted run never leaves a partial result behind.
+    '''
     file_name = os.path.basename(cfg_file)
     result_file = os.path.join(output_dir, file_name)
+    tmp_file = "{}.tmp".format(result_file)
     args = komondor_args.copy()
-    args["stats"] = result_file
-    k = Komondor(executable=komondor_executable)
-    (proc, stdout, stderr) = k.run(cfg_file, **args)
-    return stderr
+    args["stats"] = tmp_file
+    try:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        if komondor is None:
+            komondor = Komondor(executable=komondor_executable)
+        komondor.run(cfg_file, **args)
+        os.replace(tmp_file, result_file)
+    except (OSError, ValueError, RuntimeError) as err:
+        return (cfg_file, str(err))
+    return (cfg_file, None)
+
+
+class KomondorExecutor(object):
+    """Runs Komondor simulations with bounded concurrency.
+
+    Every simulation is a komondor_main process, so the jobs are managed by
+    threads instead of a Python process per core. Each running simulation
+    is pinned to one of cpus if given. The executor is reusable until
+    shutdown() is called.
+
+    :param int max_workers: Maximum number of parallel simulations, by
+        default the number of cpus or cores.
+    :param list cpus: CPUs to pin the simulations to.
+    :param float timeout: Seconds after which a simulation is killed.
+    :param dict komondor_args: Default arguments of Komondor.run, e.g. time
+        and seed.
+    """
+    def __init__(self,
+                 executable=None,
+                 max_workers=None,
+                 cpus=None,
+                 timeout=None,
+                 komondor_args={}):
+        self.executable = executable
+        self.cpus = list(cpus) if cpus else None
+        if self.cpus:
+            unavailable = set(self.cpus) - os.sched_getaffinity(0)
+            if unavailable:
+                raise ValueError("CPUs {} are not available."
+                                 .format(sorted(unavailable)))
+        if not max_workers:
+            max_workers = len(self.cpus) if self.cpus else os.cpu_count()
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.komondor_args = dict(komondor_args)
+        self._free_cpus = None
+        if self.cpus:
+            self._free_cpus = queue.Queue()
+            # Spread the workers over the cpus if there are more workers
+            for i in range(max_workers):
+                self._free_cpus.put(self.cpus[i % len(self.cpus)])
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._running = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(kill=exc_type is not None)
+
+    def submit(self, cfg_file, output_dir, **komondor_args):
+        '''
+        Schedules the simulation of cfg_file. Returns a future of the tuple
+        (cfg_file, error) run_komondor_worker returns.
+        '''
+        if self._shutdown:
+            raise RuntimeError("KomondorExecutor has been shut down.")
+        args = self.komondor_args.copy()
+        args.update(komondor_args)
+        return self._pool.submit(self._run, cfg_file, output_dir, args)
+
+    def run(self, cfg_files, output_dir, **komondor_args):
+        '''
+        Simulates all cfg_files and yields (cfg_file, error) tuples in
+        order of completion.
+        '''
+        futures = [self.submit(f, output_dir, **komondor_args)
+                   for f in cfg_files]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            # The consumer stopped early, drop the remaining jobs
+            for future in futures:
+                future.cancel()
+
+    def _run(self, cfg_file, output_dir, komondor_args):
+        if self._shutdown:
+            return (cfg_file, "KomondorExecutor has been shut down.")
+        cpu = self._free_cpus.get() if self._free_cpus else None
+        try:
+            komondor = Komondor(executable=self.executable)
+        except ValueError as err:
+            return (cfg_file, str(err))
+        args = komondor_args.copy()
+        args.setdefault("timeout", self.timeout)
+        if cpu is not None:
+            args["cpus"] = [cpu]
+        with self._lock:
+            self._running.add(komondor)
+        try:
+            return run_komondor_worker(cfg_file,
+                                       output_dir=output_dir,
+                                       komondor_args=args,
+                                       komondor=komondor)
+        finally:
+            with self._lock:
+                self._running.discard(komondor)
+            if cpu is not None:
+                self._free_cpus.put(cpu)
+
+    def shutdown(self, wait=True, kill=False):
+        '''
+        Stops accepting jobs, pending jobs return an error without running.
+        With kill the running simulations are killed as well.
+        '''
+        self._shutdown = True
+        if kill:
+            with self._lock:
+                for komondor in self._running:
+                    komondor.kill()
+        self._pool.shutdown(wait=wait)
 
 
 class Komondor(object):
@@ -23,15 +154,24 @@ class Komondor(object):
         if not executable:
             executable = which('komondor_main')
         self.executable = executable
+        self.process = None
 
         if not (self.executable and os.path.isfile(self.executable)):
             raise ValueError("Komondor executable {} not found."
                              .format(executable))
 
-    def run(self, cfg, time=100, seed=1, stats=None, **kwargs):
+    def kill(self):
+        process = self.process
+        if process and process.poll() is None:
+            process.kill()
+
+    def run(self, cfg, time=100, seed=1, stats=None, timeout=None,
+            cpus=None, **kwargs):
         '''
         :param int time: Simulation time in seconds.
         :param int seed: Random seed.
+        :param float timeout: Seconds after which Komondor is killed.
+        :param list cpus: CPUs Komondor is pinned to.
         '''
 
         defaults = {
@@ -55,7 +195,22 @@ class Komondor(object):
         cmd = [self.executable] + args
 
         proc = subprocess.Popen(cmd, **kwargs)
-        (stdout, stderr) = proc.communicate()
+        self.process = proc
+        try:
+            if cpus:
+                try:
+                    os.sched_setaffinity(proc.pid, cpus)
+                except ProcessLookupError:
+                    # Already finished
+                    pass
+            (stdout, stderr) = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise RuntimeError("Komondor timed out after {} seconds."
+                               .format(timeout))
+        finally:
+            self.process = None
         if proc.returncode != 0:
             raise RuntimeError("""Komondor exited with error code {}: \n
                                   stdout: {}\n
@@ -0,0 +1,284 @@
+import os
+import json
+
+from .komondor_config import KomondorConfig
+from .komondor_stats import KomondorStats, KomondorSeedStats
+from .komondor_store import KomondorStore
+
+
+def read_komondor_manifest(config_dir):
+    '''
+    Returns the config file names of the last built topology or None if no
+    manifest has been written to the cache directory yet.
+    '''
+    path = os.path.join(config_dir, KomondorCache.MANIFEST)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class KomondorCache(object):
+    """Content-addressed cache of Komondor configs and results.
+
+    Config and result files are stored as <fingerprint>.cfg in the input and
+    output directory. Files with other names, e.g. caches written by
+    previous versions, are indexed by the fingerprint of their content.
+    Fingerprints and results are kept in a KomondorStore, so every file is
+    parsed only once. Results of configs simulated with several seeds are
+    kept per seed in output/seeds/<seed>, the result in the output
+    directory is their mean. Results of shorter or longer simulation times
+    are kept in output/horizons/<time>, the longest one is the result.
+    """
+    MANIFEST = "manifest"
+    FAILURES = "failures.json"
+    SEEDS = "seeds"
+    HORIZONS = "horizons"
+
+    def __init__(self, config_dir):
+        self.config_dir = os.path.abspath(config_dir)
+        self.input_dir = os.path.join(self.config_dir, "input")
+        self.output_dir = os.path.join(self.config_dir, "output")
+        self.seeds_dir = os.path.join(self.output_dir, self.__class__.SEEDS)
+        self.horizons_dir = os.path.join(self.output_dir,
+                                         self.__class__.HORIZONS)
+        self.index = {}
+        self.store = KomondorStore(
+            os.path.join(self.config_dir, KomondorStore.DATABASE))
+
+    @staticmethod
+    def _cfg_files(directory):
+        return [f for f in sorted(os.listdir(directory)) if f.endswith(".cfg")]
+
+    def load(self):
+        '''
+        Synchronizes the store with the cache directories. Only files that
+        are new or changed since the last load are parsed.
+        '''
+        known = self.store.config_mtimes()
+        for fname in self._cfg_files(self.input_dir):
+            path = os.path.join(self.input_dir, fname)
+            mtime = os.path.getmtime(path)
+            if known.pop(fname, None) != mtime:
+                self.store.add_config(fname, KomondorConfig(path),
+                                      mtime=mtime, commit=False)
+        for fname in known:
+            self.store.remove_config(fname, commit=False)
+
+        known = self.store.result_mtimes()
+        for fname in self._cfg_files(self.output_dir):
+            path = os.path.join(self.output_dir, fname)
+            mtime = os.path.getmtime(path)
+            if known.pop(fname, None) != mtime:
+                self.add_result(fname, commit=False)
+        for fname in known:
+            self.store.remove_result(fname, commit=False)
+        self.store.commit()
+        self.index = self.store.fingerprints()
+        return self
+
+    def add_result(self, fname, commit=True):
+        '''
+        Adds the result file fname of the output directory to the store.
+        Returns False if the result is invalid.
+        '''
+        path = os.path.join(self.output_dir, fname)
+        try:
+            result = KomondorStats(path)
+        except ValueError:
+            result = KomondorStats()
+        if not result.is_valid():
+            self.store.remove_result(fname, commit=commit)
+            return False
+        self.store.add_result(fname, result, mtime=os.path.getmtime(path),
+                              commit=commit)
+        seed_stats = self.read_seed_results(fname)
+        if seed_stats.is_valid():
+            self.store.add_wlan_stats(fname, seed_stats, commit=commit)
+        horizon = self.result_horizon(fname, result)
+        if horizon is not None:
+            self.store.set_horizon(fname, horizon, commit=commit)
+        return True
+
+    def horizon_dir(self, horizon):
+        path = os.path.join(self.horizons_dir, "{:g}".format(horizon))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def result_horizon(self, fname, result):
+        '''
+        Returns the simulation time of the horizon result equal to result
+        or None if result has not been simulated for a specific horizon.
+        '''
+        if not os.path.isdir(self.horizons_dir):
+            return None
+        items = [list(node.items()) for node in result]
+        for horizon in sorted(os.listdir(self.horizons_dir),
+                              key=float, reverse=True):
+            path = os.path.join(self.horizons_dir, horizon, fname)
+            if not os.path.isfile(path):
+                continue
+            try:
+                horizon_result = KomondorStats(path)
+            except ValueError:
+                continue
+            if [list(node.items()) for node in horizon_result] == items:
+                return float(horizon)
+        return None
+
+    def add_horizon_result(self, fname, horizon):
+        '''
+        Makes the result of fname simulated for horizon seconds its result.
+        Returns False if the result is invalid.
+        '''
+        path = os.path.join(self.horizon_dir(horizon), fname)
+        try:
+            result = KomondorStats(path)
+        except ValueError:
+            return False
+        if not result.is_valid():
+            return False
+        self.write_result(fname, result, horizon=horizon)
+        return True
+
+    def seed_dir(self, seed):
+        path = os.path.join(self.seeds_dir, str(seed))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def seeds(self, fname):
+        '''
+        Returns the seeds fname has a result of.
+        '''
+        if not os.path.isdir(self.seeds_dir):
+            return []
+        return sorted(int(seed) for seed in os.listdir(self.seeds_dir)
+                      if os.path.isfile(os.path.join(self.seeds_dir, seed,
+                                                     fname)))
+
+    def read_seed_results(self, fname):
+        '''
+        Returns the KomondorSeedStats of all seeds fname was simulated with.
+        '''
+        seed_stats = KomondorSeedStats()
+        if not os.path.isdir(self.seeds_dir):
+            return seed_stats
+        for seed in sorted(os.listdir(self.seeds_dir)):
+            path = os.path.join(self.seeds_dir, seed, fname)
+            if not os.path.isfile(path):
+                continue
+            try:
+                seed_stats.add(KomondorStats(path))
+            except ValueError:
+                continue
+        return seed_stats
+
+    def aggregate_seeds(self, fname):
+        '''
+        Writes the mean of the seed results of fname as its result and
+        stores their aggregates. Returns the KomondorSeedStats or None if
+        there is no valid seed result.
+        '''
+        seed_stats = self.read_seed_results(fname)
+        if not seed_stats.is_valid():
+            return None
+        self.write_result(fname, seed_stats.mean(),
+                          wlan_stats=seed_stats.wlan_summaries())
+        return seed_stats
+
+    def file_name(self, config):
+        return self.index.get(config.fingerprint())
+
+    def has_result(self, fname):
+        return os.path.isfile(os.path.join(self.output_dir, fname))
+
+    def has_valid_result(self, fname):
+        if self.store.has_result(fname):
+            return True
+        if not self.has_result(fname):
+            return False
+        # Simulated since the last load
+        return self.add_result(fname)
+
+    def add(self, config):
+        '''
+        Writes config to the cache unless a config with the same
+        fingerprint exists. Returns the file name of the cached config.
+        '''
+        fingerprint = config.fingerprint()
+        fname = self.index.get(fingerprint)
+        if not fname:
+            fname = "{}.cfg".format(fingerprint)
+            path = os.path.join(self.input_dir, fname)
+            with open(path, 'w') as f:
+                config.write(f)
+            self.store.add_config(fname, config,
+                                  mtime=os.path.getmtime(path))
+            self.index[fingerprint] = fname
+        return fname
+
+    def write_result(self, fname, result, horizon=None, wlan_stats=None):
+        '''
+        Writes result as the result of fname. horizon is the simulation
+        time of result if it differs from the default, wlan_stats the
+        KomondorWlanSummary list of a result aggregating several seeds.
+        '''
+        path = os.path.join(self.output_dir, fname)
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, 'w') as f:
+            result.write(f)
+        os.replace(tmp_path, path)
+        self.store.add_result(fname, result, mtime=os.path.getmtime(path),
+                              commit=False)
+        if horizon is not None:
+            self.store.set_horizon(fname, horizon, commit=False)
+        if wlan_stats:
+            self.store.add_wlan_summaries(fname, wlan_stats, commit=False)
+        self.store.commit()
+        return path
+
+    def clear(self):
+        for d in [self.input_dir, self.output_dir]:
+            for f in os.listdir(d):
+                if f.endswith((".cfg", ".tmp")):
+                    os.remove(os.path.join(d, f))
+        for parent in [self.seeds_dir, self.horizons_dir]:
+            if not os.path.isdir(parent):
+                continue
+            for sub_dir in os.listdir(parent):
+                d = os.path.join(parent, sub_dir)
+                for f in os.listdir(d):
+                    if f.endswith((".cfg", ".tmp")):
+                        os.remove(os.path.join(d, f))
+        for f in [self.__class__.MANIFEST, self.__class__.FAILURES]:
+            path = os.path.join(self.config_dir, f)
+            if os.path.isfile(path):
+                os.remove(path)
+        self.store.clear()
+        self.index = {}
+
+    def write_manifest(self, fnames):
+        path = os.path.join(self.config_dir, self.__class__.MANIFEST)
+        with open(path, 'w') as f:
+            f.writelines("{}\n".format(fname) for fname in fnames)
+        return path
+
+    def read_manifest(self):
+        return read_komondor_manifest(self.config_dir)
+
+    def read_failures(self):
+        path = os.path.join(self.config_dir, self.__class__.FAILURES)
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_failures(self, failures):
+        path = os.path.join(self.config_dir, self.__class__.FAILURES)
+        if not failures:
+            if os.path.isfile(path):
+                os.remove(path)
+            return None
+        with open(path, 'w') as f:
+            json.dump(failures, f, indent=2, sort_keys=True)
+        return path
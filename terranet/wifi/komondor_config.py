@@ -1,5 +1,6 @@
 import os
 import itertools
+import hashlib
 import collections
 from configparser import ConfigParser
 
@@ -43,6 +44,18 @@ class KomondorBaseConfig(ConfigParser):
     def nodes(self):
         return [self[x] for x in self.sections() if not x == 'System']
 
+    def fingerprint(self):
+        '''
+        Canonical hash of the config content. Sections and options are
+        sorted, so two configs comparing equal share the same fingerprint.
+        '''
+        digest = hashlib.sha1()
+        for section in sorted(self.sections()):
+            digest.update("[{}]\n".format(section).encode())
+            for key, value in sorted(self[section].items()):
+                digest.update("{}={}\n".format(key, value).encode())
+        return digest.hexdigest()
+
 
 class KomondorConfig(KomondorBaseConfig):
     def __init__(self, cfg_file=None):
@@ -185,3 +198,15 @@ class KomondorResult(KomondorBaseConfig):
 
     def wlans(self):
         return list(sorted(set([self[x]['wlan'] for x in self.sections()])))
+
+    def is_valid(self):
+        if not self.sections():
+            return False
+        for x in self.sections():
+            if 'wlan' not in self[x]:
+                return False
+            try:
+                int(self[x]['throughput'])
+            except (KeyError, ValueError):
+                return False
+        return True
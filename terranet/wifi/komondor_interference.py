@@ -0,0 +1,122 @@
+import math
+
+
+def free_space_path_loss(distance, central_freq):
+    '''
+    Free space path loss in dB for distance in meters and central_freq in
+    GHz. Distances below one meter are treated as one meter.
+    '''
+    distance = max(distance, 1.0)
+    return (20 * math.log10(distance) +
+            20 * math.log10(central_freq * 1e9) - 147.55)
+
+
+# Path loss models of Komondor by model id. Free space propagation has the
+# lowest loss of all models, so it is used as a lower bound for models that
+# are not listed. This can only merge clusters, never split interfering
+# ones.
+PATH_LOSS_MODELS = {
+    0: free_space_path_loss
+}
+
+
+def _path_loss_model(system):
+    model = int(system.get("path_loss_model_default", 0))
+    return PATH_LOSS_MODELS.get(model, free_space_path_loss)
+
+
+def _position(node):
+    return tuple(float(node[k]) for k in ("x", "y", "z"))
+
+
+def received_power(system, tx_node, rx_node, central_freq=None):
+    '''
+    Strongest power in dBm rx_node can receive from tx_node.
+    '''
+    path_loss = _path_loss_model(system)
+    if central_freq is None:
+        central_freq = float(tx_node["central_freq"])
+    distance = math.dist(_position(tx_node), _position(rx_node))
+    return (float(tx_node["tpc_max"]) +
+            float(tx_node.get("tx_antenna_gain", 0)) +
+            float(rx_node.get("rx_antenna_gain", 0)) -
+            path_loss(distance, central_freq))
+
+
+def can_interfere(system, tx_node, rx_node, central_freq=None):
+    '''
+    A node is considered to interfere with a receiver if its signal reaches
+    the receiver's CCA threshold or the noise level, whichever is lower.
+    '''
+    threshold = min(float(rx_node["cca_default"]),
+                    float(system.get("noise_level", rx_node["cca_default"])))
+    return received_power(system, tx_node, rx_node,
+                          central_freq=central_freq) >= threshold
+
+
+def channels_overlap(channels_a, channels_b):
+    '''
+    True if any channel of channels_a shares a basic Komondor channel with
+    any channel of channels_b.
+    '''
+    return any(a.overlaps(b) for a in channels_a for b in channels_b)
+
+
+def interference_graph(config, available_channels):
+    '''
+    Builds the interference graph between the BSSs of config. Returns a
+    dict mapping each access point name to the set of access point names it
+    can interfere with. available_channels maps access point names to the
+    channels the access point may use. Two BSSs interfere if they can share
+    a basic channel and any node of one BSS reaches any node of the other.
+    With an adjacent channel model every pair of BSSs within range
+    interferes.
+    '''
+    system = config.system()
+    adjacent_channels = int(system.get("adjacent_channel_model", 0)) != 0
+    aps = config.access_points()
+    bss = {ap.name: [ap] + config.get_stations_by_access_point(ap)
+           for ap in aps}
+    # Use the lowest frequency available, it has the lowest path loss
+    min_freq = {ap.name: min(ch.f0 for ch in available_channels[ap.name]) /
+                1000 for ap in aps}
+    graph = {ap.name: set() for ap in aps}
+    for i, ap_a in enumerate(aps):
+        for ap_b in aps[i+1:]:
+            channels_a = available_channels[ap_a.name]
+            channels_b = available_channels[ap_b.name]
+            if not (adjacent_channels or
+                    channels_overlap(channels_a, channels_b)):
+                continue
+            freq = min(min_freq[ap_a.name], min_freq[ap_b.name])
+            if any(can_interfere(system, u, v, central_freq=freq) or
+                   can_interfere(system, v, u, central_freq=freq)
+                   for u in bss[ap_a.name] for v in bss[ap_b.name]):
+                graph[ap_a.name].add(ap_b.name)
+                graph[ap_b.name].add(ap_a.name)
+    return graph
+
+
+def connected_components(graph):
+    '''
+    Returns the connected components of graph as lists of nodes, keeping
+    the order of the graph's keys.
+    '''
+    components = []
+    visited = set()
+    for node in graph:
+        if node in visited:
+            continue
+        component = []
+        stack = [node]
+        visited.add(node)
+        while stack:
+            current = stack.pop()
+            component.append(current)
+            for neighbour in graph[current]:
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    stack.append(neighbour)
+        order = list(graph)
+        components.append(sorted(component, key=order.index))
+    return components
@@ -0,0 +1,266 @@
+import math
+import collections
+
+
+class KomondorNodeStats(object):
+    """Typed result of a single node of a Komondor stats file."""
+    __slots__ = ("name", "wlan", "throughput", "delay", "values")
+
+    def __init__(self, name, wlan=None, throughput=None, delay=math.nan,
+                 values=None):
+        self.name = name
+        self.wlan = wlan
+        self.throughput = throughput
+        self.delay = delay
+        # Other numeric fields of the node
+        if values is None:
+            values = collections.OrderedDict()
+        self.values = values
+
+    def copy(self, **kwargs):
+        node = KomondorNodeStats(self.name, wlan=self.wlan,
+                                 throughput=self.throughput,
+                                 delay=self.delay,
+                                 values=collections.OrderedDict(self.values))
+        for key, value in kwargs.items():
+            setattr(node, key, value)
+        return node
+
+    def items(self):
+        yield ("throughput", str(self.throughput))
+        yield ("delay", repr(self.delay))
+        yield ("wlan", self.wlan)
+        for key, value in self.values.items():
+            yield (key, value if isinstance(value, str) else repr(value))
+
+
+def _parse_value(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class KomondorStats(object):
+    """Komondor stats file parsed in a single pass.
+
+    Lean replacement for KomondorResult: every node is a KomondorNodeStats
+    with typed fields, so aggregations do not reparse strings.
+    """
+    __slots__ = ("cfg_file", "nodes")
+
+    def __init__(self, cfg_file=None, nodes=None):
+        self.cfg_file = cfg_file
+        self.nodes = collections.OrderedDict()
+        for node in nodes or []:
+            self.nodes[node.name] = node
+        if cfg_file:
+            self.read(cfg_file)
+
+    def read(self, cfg_file):
+        node = None
+        with open(cfg_file) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line[0] in "#;":
+                    continue
+                if line[0] == "[":
+                    name = line[1:line.index("]")]
+                    node = KomondorNodeStats(name)
+                    self.nodes[name] = node
+                    continue
+                if node is None:
+                    continue
+                key, _, value = line.partition("=")
+                key = key.strip()
+                value = value.strip()
+                if key == "wlan":
+                    node.wlan = value
+                elif key == "throughput":
+                    node.throughput = int(value)
+                elif key == "delay":
+                    node.delay = float(value)
+                else:
+                    node.values[key] = _parse_value(value)
+        return self
+
+    def __getitem__(self, name):
+        return self.nodes[name]
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def sections(self):
+        return list(self.nodes)
+
+    def has_section(self, name):
+        return name in self.nodes
+
+    def update(self, other):
+        '''
+        Adds the nodes of other, e.g. to compose independent results.
+        '''
+        for node in other:
+            self.nodes[node.name] = node.copy()
+
+    def nodes_by_wlan(self, wlan):
+        return [x for x in self.nodes.values() if x.wlan == wlan]
+
+    def total_throughput(self):
+        return sum(x.throughput for x in self.nodes.values())
+
+    def wlan_throughput(self, wlan):
+        return sum(x.throughput for x in self.nodes.values()
+                   if x.wlan == wlan)
+
+    def wlans(self):
+        return sorted(set(x.wlan for x in self.nodes.values()))
+
+    def is_valid(self):
+        return bool(self.nodes) and all(
+            x.wlan is not None and x.throughput is not None
+            for x in self.nodes.values())
+
+    def write(self, f):
+        for node in self.nodes.values():
+            f.write("[{}]\n".format(node.name))
+            for key, value in node.items():
+                f.write("{}={}\n".format(key, value))
+            f.write("\n")
+
+
+# Two-sided 95% quantiles of Student's t distribution by degrees of freedom
+T_QUANTILES_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+                  2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120,
+                  2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064,
+                  2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def confidence_half_width(variance, samples):
+    '''
+    Half width of the 95% confidence interval of a mean of samples with
+    the sample variance variance. Zero for less than two samples.
+    '''
+    if samples < 2:
+        return 0.0
+    df = samples - 1
+    t = T_QUANTILES_95[df - 1] if df <= len(T_QUANTILES_95) else 1.96
+    return t * math.sqrt(variance / samples)
+
+
+def _mean_variance(values):
+    n = len(values)
+    if not n:
+        return (math.nan, math.nan)
+    mean = math.fsum(values) / n
+    if n < 2:
+        return (mean, 0.0)
+    return (mean, math.fsum((x - mean) ** 2 for x in values) / (n - 1))
+
+
+class KomondorWlanSummary(object):
+    """Mean and sample variance of a WLAN over the seeds of a config."""
+    __slots__ = ("wlan", "samples", "throughput_mean", "throughput_var",
+                 "delay_mean", "delay_var")
+
+    def __init__(self, wlan, samples, throughput_mean, throughput_var,
+                 delay_mean=math.nan, delay_var=math.nan):
+        self.wlan = wlan
+        self.samples = samples
+        self.throughput_mean = throughput_mean
+        self.throughput_var = throughput_var
+        self.delay_mean = delay_mean
+        self.delay_var = delay_var
+
+    def copy(self, **kwargs):
+        summary = KomondorWlanSummary(self.wlan, self.samples,
+                                      self.throughput_mean,
+                                      self.throughput_var,
+                                      delay_mean=self.delay_mean,
+                                      delay_var=self.delay_var)
+        for key, value in kwargs.items():
+            setattr(summary, key, value)
+        return summary
+
+    def throughput_half_width(self):
+        return confidence_half_width(self.throughput_var, self.samples)
+
+    def throughput_lcb(self):
+        '''
+        Lower bound of the 95% confidence interval of the throughput.
+        '''
+        return self.throughput_mean - self.throughput_half_width()
+
+
+class KomondorSeedStats(object):
+    """Results of one config simulated with several seeds.
+
+    The throughput of a WLAN is summed over its nodes per seed, the delay
+    is averaged over the nodes reporting one.
+    """
+    __slots__ = ("results",)
+
+    def __init__(self, results=None):
+        self.results = list(results or [])
+
+    def add(self, result):
+        self.results.append(result)
+
+    @property
+    def samples(self):
+        return len(self.results)
+
+    def is_valid(self):
+        return bool(self.results) and all(x.is_valid() for x in self.results)
+
+    def mean(self):
+        '''
+        Returns a KomondorStats with the per node mean over all seeds.
+        '''
+        first = self.results[0]
+        mean = KomondorStats()
+        for node in first:
+            samples = [x[node.name] for x in self.results
+                       if node.name in x]
+            throughput, _ = _mean_variance([x.throughput for x in samples])
+            delays = [x.delay for x in samples if not math.isnan(x.delay)]
+            delay, _ = _mean_variance(delays)
+            mean.nodes[node.name] = node.copy(throughput=round(throughput),
+                                              delay=delay)
+        return mean
+
+    def wlan_summaries(self):
+        summaries = []
+        for wlan in self.results[0].wlans():
+            throughputs = [x.wlan_throughput(wlan) for x in self.results]
+            delays = []
+            for result in self.results:
+                node_delays = [x.delay for x in result.nodes_by_wlan(wlan)
+                               if not math.isnan(x.delay)]
+                if node_delays:
+                    delays.append(math.fsum(node_delays) / len(node_delays))
+            summaries.append(KomondorWlanSummary(
+                wlan, self.samples, *(_mean_variance(throughputs) +
+                                      _mean_variance(delays))))
+        return summaries
+
+    def converged(self, precision):
+        '''
+        True if the confidence interval of every WLAN throughput is within
+        precision times its mean.
+        '''
+        if self.samples < 2:
+            return False
+        return all(x.throughput_half_width() <=
+                   precision * abs(x.throughput_mean)
+                   for x in self.wlan_summaries())
@@ -0,0 +1,305 @@
+import sqlite3
+import collections.abc
+
+from .channel import Channel
+from .komondor_stats import KomondorStats, KomondorNodeStats, \
+                            KomondorWlanSummary
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS configs (
+    file TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS configs_fingerprint ON configs (fingerprint);
+CREATE TABLE IF NOT EXISTS access_points (
+    file TEXT NOT NULL,
+    node TEXT NOT NULL,
+    wlan_code TEXT NOT NULL,
+    channel INTEGER,
+    primary_channel INTEGER NOT NULL,
+    min_channel_allowed INTEGER NOT NULL,
+    max_channel_allowed INTEGER NOT NULL,
+    PRIMARY KEY (file, node)
+);
+CREATE TABLE IF NOT EXISTS result_files (
+    file TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    file TEXT NOT NULL,
+    node TEXT NOT NULL,
+    wlan TEXT NOT NULL,
+    throughput INTEGER NOT NULL,
+    delay TEXT NOT NULL,
+    PRIMARY KEY (file, node)
+);
+CREATE TABLE IF NOT EXISTS wlan_stats (
+    file TEXT NOT NULL,
+    wlan TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    throughput_mean REAL NOT NULL,
+    throughput_var REAL NOT NULL,
+    delay_mean TEXT NOT NULL,
+    delay_var TEXT NOT NULL,
+    PRIMARY KEY (file, wlan)
+);
+CREATE TABLE IF NOT EXISTS result_horizons (
+    file TEXT PRIMARY KEY,
+    horizon REAL NOT NULL
+);
+'''
+
+
+class KomondorFileMapping(collections.abc.Mapping):
+    """Read-only mapping of file names that loads its values on access."""
+    def __init__(self, files, loader):
+        self.files = list(files)
+        self._files = set(self.files)
+        self.loader = loader
+
+    def __getitem__(self, fname):
+        if fname not in self._files:
+            raise KeyError(fname)
+        return self.loader(fname)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
+class KomondorStore(object):
+    """SQLite index of Komondor configs and results.
+
+    Holds the fingerprint and access point channels of every cached config
+    and the per node results, so consumers can query them without parsing
+    the .cfg files again. The .cfg files stay the source of truth, the
+    store is rebuilt from them if it is deleted.
+    """
+    DATABASE = "komondor.db"
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        if not self._connection:
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def data_version(self):
+        '''
+        Changes whenever another connection commits to the store.
+        '''
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+
+    def clear(self):
+        with self.connection as conn:
+            for table in ["configs", "access_points",
+                          "result_files", "results", "wlan_stats",
+                          "result_horizons"]:
+                conn.execute("DELETE FROM {}".format(table))
+
+    def config_mtimes(self):
+        rows = self.connection.execute("SELECT file, mtime FROM configs")
+        return dict(rows)
+
+    def result_mtimes(self):
+        rows = self.connection.execute("SELECT file, mtime FROM result_files")
+        return dict(rows)
+
+    def add_config(self, fname, config, mtime=0, commit=True):
+        conn = self.connection
+        self.remove_config(fname, commit=False)
+        conn.execute("INSERT INTO configs VALUES (?, ?, ?)",
+                     (fname, config.fingerprint(), mtime))
+        rows = []
+        for ap in config.access_points():
+            min_channel = int(ap["min_channel_allowed"])
+            max_channel = int(ap["max_channel_allowed"])
+            rows.append((fname, ap.name, ap["wlan_code"],
+                         Channel.channel_num(min_channel, max_channel),
+                         int(ap["primary_channel"]),
+                         min_channel, max_channel))
+        conn.executemany("INSERT INTO access_points "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        if commit:
+            conn.commit()
+
+    def remove_config(self, fname, commit=True):
+        conn = self.connection
+        conn.execute("DELETE FROM configs WHERE file = ?", (fname,))
+        conn.execute("DELETE FROM access_points WHERE file = ?", (fname,))
+        if commit:
+            conn.commit()
+
+    def add_result(self, fname, result, mtime=0, commit=True):
+        conn = self.connection
+        self.remove_result(fname, commit=False)
+        conn.execute("INSERT INTO result_files VALUES (?, ?)",
+                     (fname, mtime))
+        rows = [(fname, node.name, node.wlan, node.throughput,
+                 repr(node.delay)) for node in result]
+        conn.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?)", rows)
+        if commit:
+            conn.commit()
+
+    def remove_result(self, fname, commit=True):
+        conn = self.connection
+        conn.execute("DELETE FROM result_files WHERE file = ?", (fname,))
+        conn.execute("DELETE FROM results WHERE file = ?", (fname,))
+        conn.execute("DELETE FROM wlan_stats WHERE file = ?", (fname,))
+        conn.execute("DELETE FROM result_horizons WHERE file = ?", (fname,))
+        if commit:
+            conn.commit()
+
+    def set_horizon(self, fname, horizon, commit=True):
+        '''
+        Records the simulation time of a result that was simulated for a
+        shorter or longer time than the default.
+        '''
+        conn = self.connection
+        conn.execute("INSERT OR REPLACE INTO result_horizons VALUES (?, ?)",
+                     (fname, horizon))
+        if commit:
+            conn.commit()
+
+    def horizon(self, fname):
+        '''
+        Returns the simulation time of the result of fname or None if it
+        was simulated with the default time.
+        '''
+        row = self.connection.execute(
+            "SELECT horizon FROM result_horizons WHERE file = ?",
+            (fname,)).fetchone()
+        return row[0] if row else None
+
+    def add_wlan_stats(self, fname, seed_stats, commit=True):
+        '''
+        Stores the per WLAN aggregates of a config simulated with several
+        seeds.
+        '''
+        self.add_wlan_summaries(fname, seed_stats.wlan_summaries(),
+                                commit=commit)
+
+    def add_wlan_summaries(self, fname, summaries, commit=True):
+        '''
+        Stores the KomondorWlanSummary of every WLAN of fname, e.g. taken
+        over from the results fname was derived from.
+        '''
+        conn = self.connection
+        conn.execute("DELETE FROM wlan_stats WHERE file = ?", (fname,))
+        rows = [(fname, x.wlan, x.samples, x.throughput_mean,
+                 x.throughput_var, repr(x.delay_mean), repr(x.delay_var))
+                for x in summaries]
+        conn.executemany("INSERT INTO wlan_stats "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        if commit:
+            conn.commit()
+
+    def samples(self, fname):
+        '''
+        Returns the number of seeds the result of fname aggregates, 1 for
+        single runs and 0 if there is no result.
+        '''
+        row = self.connection.execute(
+            "SELECT MIN(samples) FROM wlan_stats WHERE file = ?",
+            (fname,)).fetchone()
+        if row[0] is not None:
+            return row[0]
+        return 1 if self.has_result(fname) else 0
+
+    def wlan_stats(self, fname=None):
+        '''
+        Returns the KomondorWlanSummary of every WLAN of fname or of all
+        results aggregated over several seeds.
+        '''
+        query = ("SELECT file, wlan, samples, throughput_mean, "
+                 "throughput_var, delay_mean, delay_var FROM wlan_stats")
+        params = ()
+        if fname is not None:
+            query += " WHERE file = ?"
+            params = (fname,)
+        return [(f, KomondorWlanSummary(wlan, samples, t_mean, t_var,
+                                        float(d_mean), float(d_var)))
+                for (f, wlan, samples, t_mean, t_var, d_mean, d_var)
+                in self.connection.execute(query, params)]
+
+    def has_result(self, fname):
+        row = self.connection.execute(
+            "SELECT 1 FROM result_files WHERE file = ?", (fname,)).fetchone()
+        return row is not None
+
+    def fingerprints(self):
+        '''
+        Returns a dict mapping fingerprints to file names. For duplicate
+        configs the first file name in sort order is used.
+        '''
+        index = {}
+        rows = self.connection.execute(
+            "SELECT fingerprint, file FROM configs ORDER BY file")
+        for fingerprint, fname in rows:
+            index.setdefault(fingerprint, fname)
+        return index
+
+    def result_files(self):
+        rows = self.connection.execute(
+            "SELECT file FROM result_files ORDER BY file")
+        return [fname for (fname,) in rows]
+
+    def result(self, fname):
+        '''
+        Returns the result of fname as KomondorStats built from the store.
+        '''
+        rows = self.connection.execute(
+            "SELECT node, wlan, throughput, delay FROM results "
+            "WHERE file = ? ORDER BY rowid", (fname,))
+        return KomondorStats(nodes=[
+            KomondorNodeStats(node, wlan=wlan, throughput=throughput,
+                              delay=float(delay))
+            for node, wlan, throughput, delay in rows])
+
+    def wlan_throughputs(self):
+        '''
+        Yields (file, wlan, throughput) for every stored result, with the
+        throughput summed over the nodes of the WLAN.
+        '''
+        return self.connection.execute(
+            "SELECT file, wlan, SUM(throughput) FROM results "
+            "GROUP BY file, wlan")
+
+    def results(self, files):
+        return KomondorFileMapping(files, self.result)
+
+    def ap_channel_configurations(self, fname):
+        '''
+        Same as KomondorConfig.ap_channel_configurations for a stored
+        config.
+        '''
+        rows = self.connection.execute(
+            "SELECT node, wlan_code, channel, "
+            "min_channel_allowed, max_channel_allowed "
+            "FROM access_points WHERE file = ? ORDER BY rowid", (fname,))
+        return [{'name': node,
+                 'wlan_code': wlan_code,
+                 'channel': channel,
+                 'min_channel_allowed': str(min_channel_allowed),
+                 'max_channel_allowed': str(max_channel_allowed)}
+                for (node, wlan_code, channel,
+                     min_channel_allowed, max_channel_allowed) in rows]
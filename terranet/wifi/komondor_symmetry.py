@@ -0,0 +1,168 @@
+import math
+
+from .komondor_stats import KomondorStats
+
+
+# Node options set per channel assignment. All other options describe the
+# node itself and have to match for two nodes to be interchangeable.
+CHANNEL_OPTIONS = ("primary_channel", "min_channel_allowed",
+                   "max_channel_allowed", "central_freq")
+IDENTITY_OPTIONS = ("wlan_code",)
+POSITION_OPTIONS = ("x", "y", "z")
+
+
+def _node_params(node):
+    ignored = CHANNEL_OPTIONS + IDENTITY_OPTIONS + POSITION_OPTIONS
+    return tuple(sorted((k, v) for k, v in node.items() if k not in ignored))
+
+
+def _position(node):
+    return tuple(float(node[k]) for k in POSITION_OPTIONS)
+
+
+def _distance(node_a, node_b):
+    return math.dist(_position(node_a), _position(node_b))
+
+
+def _bss_signature(config, ap):
+    stations = config.get_stations_by_access_point(ap)
+    return (_node_params(ap),
+            tuple(_node_params(sta) for sta in stations),
+            tuple(round(_distance(ap, sta), 6) for sta in stations))
+
+
+def komondor_symmetries(config, max_symmetries=1024):
+    '''
+    Returns the node mappings of config which swap access points (together
+    with their stations) without changing node parameters or any distance
+    between two nodes. The identity is always the first mapping. At most
+    max_symmetries mappings are searched.
+    '''
+    aps = config.access_points()
+    stations = {ap.name: config.get_stations_by_access_point(ap)
+                for ap in aps}
+    signatures = {ap.name: _bss_signature(config, ap) for ap in aps}
+    symmetries = []
+
+    def node_map(assignment):
+        mapping = {}
+        for ap, target in zip(aps, assignment):
+            mapping[ap.name] = target.name
+            for sta, target_sta in zip(stations[ap.name],
+                                       stations[target.name]):
+                mapping[sta.name] = target_sta.name
+        return mapping
+
+    def consistent(assignment):
+        # Distances between the newly assigned BSS and all previous ones
+        i = len(assignment) - 1
+        nodes_i = [aps[i]] + stations[aps[i].name]
+        targets_i = [assignment[i]] + stations[assignment[i].name]
+        for j in range(0, i + 1):
+            nodes_j = [aps[j]] + stations[aps[j].name]
+            targets_j = [assignment[j]] + stations[assignment[j].name]
+            for (u, pu) in zip(nodes_i, targets_i):
+                for (v, pv) in zip(nodes_j, targets_j):
+                    if not math.isclose(_distance(u, v), _distance(pu, pv),
+                                        abs_tol=1e-6):
+                        return False
+        return True
+
+    def search(assignment, used):
+        if len(symmetries) >= max_symmetries:
+            return
+        if len(assignment) == len(aps):
+            symmetries.append(node_map(assignment))
+            return
+        ap = aps[len(assignment)]
+        # Try the identity first, so it is the first symmetry found
+        candidates = [ap] + [x for x in aps if x.name != ap.name]
+        for target in candidates:
+            if target.name in used:
+                continue
+            if signatures[target.name] != signatures[ap.name]:
+                continue
+            assignment.append(target)
+            if consistent(assignment):
+                search(assignment, used | {target.name})
+            assignment.pop()
+
+    search([], frozenset())
+    return symmetries
+
+
+def _channel_signature(config, node_map, relabel_channels=True):
+    inverse = {v: k for k, v in node_map.items()}
+    labels = {}
+
+    def label(channel):
+        if not relabel_channels:
+            return channel
+        return labels.setdefault(channel, len(labels))
+
+    signature = []
+    for node in config.nodes():
+        source = config[inverse.get(node.name, node.name)]
+        min_channel = int(source["min_channel_allowed"])
+        max_channel = int(source["max_channel_allowed"])
+        channels = tuple(label(ch)
+                         for ch in range(min_channel, max_channel + 1))
+        primary = label(int(source["primary_channel"]))
+        # Only relabel within a band, path loss depends on the frequency
+        band = int(float(source["central_freq"]))
+        signature.append((node.name, band, channels, primary))
+    return tuple(signature)
+
+
+def canonical_representatives(configs, symmetries=None,
+                              relabel_channels=False):
+    '''
+    Collapses equivalent channel assignments. Two configs are equivalent if
+    an access point symmetry and a relabeling of the basic channels turns
+    one into the other. Returns a list with a tuple (representative index,
+    node map) for each config. The result of a config is the result of its
+    representative with node n read from node_map[n].
+
+    Relabeling channels assumes that the simulation does not depend on the
+    actual channel number, i.e. no adjacent channel interference. Channels
+    are only relabeled within a band, but Komondor derives the path loss
+    from central_freq, so relabeled results are an approximation for links
+    close to a modulation threshold, e.g. up to 11% throughput deviation on
+    HybridVirtualFiberTopo. Only access point symmetries are collapsed
+    unless relabel_channels is enabled.
+    '''
+    if not configs:
+        return []
+    if not symmetries:
+        identity = {node.name: node.name for node in configs[0].nodes()}
+        symmetries = [identity]
+    representatives = {}
+    mapping = []
+    for i, config in enumerate(configs):
+        for node_map in symmetries:
+            signature = _channel_signature(config, node_map,
+                                           relabel_channels=relabel_channels)
+            if signature in representatives:
+                mapping.append((representatives[signature], node_map))
+                break
+        else:
+            identity = symmetries[0]
+            signature = _channel_signature(config, identity,
+                                           relabel_channels=relabel_channels)
+            representatives[signature] = i
+            mapping.append((i, identity))
+    return mapping
+
+
+def map_komondor_result(result, node_map, config):
+    '''
+    Builds the result of config from the result of its representative.
+    '''
+    mapped = KomondorStats()
+    for node in config.nodes():
+        source = node_map.get(node.name, node.name)
+        if not result.has_section(source):
+            continue
+        mapped.nodes[node.name] = result[source].copy(
+            name=node.name, wlan=node["wlan_code"])
+    return mapped
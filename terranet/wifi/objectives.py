@@ -0,0 +1,88 @@
+import numpy as np
+
+
+# All objectives work on the aggregates of a WLAN: its throughput and its
+# customer count. Every customer of a WLAN gets an equal share of the WLAN
+# throughput, so per customer values never have to be materialized.
+# wlan_throughputs has a row per channel configuration and a column per
+# WLAN, customer_counts has an entry per WLAN.
+
+
+def served_wlans(wlan_throughputs, customer_counts):
+    '''
+    Returns the throughput columns and customer counts of the WLANs with at
+    least one customer.
+    '''
+    served = customer_counts > 0
+    return (wlan_throughputs[:, served], customer_counts[served])
+
+
+def jains_fairness_index(wlan_throughputs, customer_counts):
+    '''
+    Jain's fairness index over all customers for each configuration:
+    (sum x)^2 / (n * sum x^2) with x = t / c for the c customers of a WLAN
+    with throughput t, i.e. (sum t)^2 / (n * sum t^2 / c).
+    '''
+    throughputs, counts = served_wlans(wlan_throughputs, customer_counts)
+    customer_count = counts.sum()
+    sum_throughputs_squared = np.square(throughputs.sum(axis=1))
+    sum_squared_throughputs = (np.square(throughputs) / counts).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fairness_index = (sum_throughputs_squared /
+                          (customer_count * sum_squared_throughputs))
+    return np.nan_to_num(fairness_index)
+
+
+def jain_x_throughput(wlan_throughputs, customer_counts):
+    total_throughput = wlan_throughputs.sum(axis=1)
+    fairness_index = jains_fairness_index(wlan_throughputs, customer_counts)
+    return {
+        'total_throughput': total_throughput,
+        'fairness_index': fairness_index,
+        'jainXtpt': fairness_index * total_throughput
+    }
+
+
+def weighted_throughput(wlan_throughputs, customer_counts, weights=None):
+    '''
+    Weighted sum of the customer throughputs. weights holds a weight per
+    WLAN, by default all customers are weighted equally.
+    '''
+    if weights is None:
+        weights = np.ones(len(customer_counts))
+    served = customer_counts > 0
+    throughputs = wlan_throughputs[:, served]
+    return {
+        'total_throughput': wlan_throughputs.sum(axis=1),
+        'weighted': throughputs @ np.asarray(weights, dtype=float)[served]
+    }
+
+
+def alpha_fair_utility(wlan_throughputs, customer_counts, alpha=1.0):
+    '''
+    Sum of the alpha-fair utilities of all customers. alpha=0 maximizes
+    the throughput, alpha=1 gives proportional fairness and large alphas
+    approach max-min fairness. Configurations leaving a customer without
+    throughput score -inf for alpha >= 1.
+    '''
+    throughputs, counts = served_wlans(wlan_throughputs, customer_counts)
+    customer_throughputs = throughputs / counts
+    with np.errstate(divide='ignore'):
+        if alpha == 1:
+            utilities = np.log(customer_throughputs)
+        else:
+            utilities = (np.power(customer_throughputs, 1 - alpha) /
+                         (1 - alpha))
+    return {
+        'total_throughput': wlan_throughputs.sum(axis=1),
+        'alphaFair': utilities @ counts
+    }
+
+
+# Objectives by name. Each returns a dict of per configuration metrics,
+# including one named like the objective which is maximized.
+OBJECTIVES = {
+    'jainXtpt': jain_x_throughput,
+    'weighted': weighted_throughput,
+    'alphaFair': alpha_fair_utility
+}
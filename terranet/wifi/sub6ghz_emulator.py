@@ -1,25 +1,65 @@
 import os
-import collections
 import math
+import time
+import collections
 import itertools
-import multiprocessing
+import threading
+import concurrent.futures
 from functools import partial
 from configparser import ConfigParser
 
+import numpy as np
 from mininet.log import info, warn
 
 from ..event import KomondorConfigChangeEvent, ChannelSwitchEvent, \
-    Sub6GhzEmulatorRegistrationEvent, \
+    MultiChannelSwitchEvent, Sub6GhzEmulatorRegistrationEvent, \
     Sub6GhzEmulatorCancelRegistrationEvent
-from .komondor import run_komondor_worker
-from .komondor_config import KomondorConfig, KomondorSystemConfig, \
-                             read_komondor_configs, read_komondor_results
+from ..link import TcBatch
+from .komondor import KomondorExecutor
+from .komondor_cache import KomondorCache
+from .channel import Channel
+from .komondor_config import KomondorConfig, KomondorSystemConfig
+from .komondor_stats import KomondorStats
+from .komondor_symmetry import komondor_symmetries, \
+                               canonical_representatives, \
+                               map_komondor_result
+from .komondor_interference import interference_graph, connected_components
+from .objectives import OBJECTIVES
+
+
+class ChannelSwitchTransaction(object):
+    """Channel configs of several access points applied at once."""
+    def __init__(self):
+        self.start = time.time()
+        self.latency = None
+        self.old_channel_configs = collections.OrderedDict()
+        self.new_channel_configs = collections.OrderedDict()
+
+    def stage(self, ap, channel_config, old_channel_config=None):
+        if ap not in self.old_channel_configs:
+            if old_channel_config is None:
+                old_channel_config = ap.get_channel_config()
+            self.old_channel_configs[ap] = old_channel_config
+        self.new_channel_configs[ap] = channel_config
+
+    def finish(self):
+        self.latency = time.time() - self.start
+        return self.latency
 
 
 class Sub6GhzEmulator(object):
+    # What to do while a missing config is simulated on demand: keep the
+    # links as they are, reject the switch or wait for the simulation.
+    INTERIM_POLICIES = ("keep", "reject", "wait")
+
     def __init__(self,
                  net=None,
                  komondor_executable=None,
+                 komondor_args=None,
+                 komondor_executor=None,
+                 komondor_seeds=1,
+                 komondor_max_seeds=None,
+                 komondor_precision=0.05,
                  komondor_config_dir=None,
                  komondor_system_cfg=None,
                  komondor_configs=None,
@@ -29,9 +69,20 @@ class Sub6GhzEmulator(object):
                  current_komondor_result=None):
         self.net = net
         self.komondor_executable = komondor_executable
+        if komondor_args is None:
+            komondor_args = {}
+        self.komondor_args = komondor_args
+        self._komondor_executor = komondor_executor
+        # Every config is simulated with komondor_seeds seeds, more are
+        # added up to komondor_max_seeds until the confidence intervals of
+        # the WLAN throughputs are within komondor_precision of the mean.
+        self.komondor_seeds = komondor_seeds
+        self.komondor_max_seeds = komondor_max_seeds
+        self.komondor_precision = komondor_precision
         self.komondor_config_dir = os.path.abspath(komondor_config_dir)
         self.komondor_input_dir = f'{self.komondor_config_dir}/input'
         self.komondor_output_dir = f'{self.komondor_config_dir}/output'
+        self.komondor_cache = KomondorCache(self.komondor_config_dir)
         if not komondor_system_cfg:
             komondor_system_cfg = KomondorSystemConfig()
         self.komondor_system_cfg = komondor_system_cfg
@@ -40,12 +91,51 @@ class Sub6GhzEmulator(object):
         self.current_komondor_file = current_komondor_file
         self.current_komondor_config = current_komondor_config
         self.current_komondor_result = current_komondor_result
+        self.komondor_index = None
+        self.channel_switch = None
+        self.channel_switch_lock = threading.Lock()
+        self.channel_switch_latency = None
+        # (bw, delay) of the interfaces shaped by apply_results
+        self.link_shaping = {}
+        self.lazy = False
+        self.interim_policy = "keep"
+        self.horizons = None
+        self.keep_fraction = 0.5
+        self.halving_objective = "jainXtpt"
+        # Guards the on demand simulations, the configs, index and results
+        # they add to and the store connection they write through
+        self.simulation_lock = threading.Lock()
+        self.pending_simulations = {}
+        self.pending_komondor_file = None
+
+    @property
+    def komondor_executor(self):
+        '''
+        Executor of all Komondor runs of the emulator, created on first use
+        with komondor_executable and komondor_args.
+        '''
+        if self._komondor_executor is None:
+            self._komondor_executor = KomondorExecutor(
+                executable=self.komondor_executable,
+                komondor_args=self.komondor_args)
+        return self._komondor_executor
+
+    def shutdown(self):
+        '''
+        Kills running simulations and shuts the Komondor executor down.
+        '''
+        if self._komondor_executor is not None:
+            self._komondor_executor.shutdown(kill=True)
+            self._komondor_executor = None
+        self.komondor_cache.store.close()
 
     def update(self, evt):
         if isinstance(evt, KomondorConfigChangeEvent):
             self.handle_komondor_config_change(evt)
         elif isinstance(evt, ChannelSwitchEvent):
             self.handle_channel_switch(evt)
+        elif isinstance(evt, MultiChannelSwitchEvent):
+            self.handle_multi_channel_switch(evt)
         elif isinstance(evt, Sub6GhzEmulatorRegistrationEvent):
             self.handle_registration(evt)
         elif isinstance(evt, Sub6GhzEmulatorCancelRegistrationEvent):
@@ -62,26 +152,124 @@ class Sub6GhzEmulator(object):
     def handle_channel_switch(self, evt):
         info("Sub6GhzEmulator: Node {} triggered channel switch.\n"
              .format(evt.node.name))
-        ap = evt.node
-        client_nodes = ap.connected_stations()
+        transaction = self.begin_channel_switch()
         try:
-            self.adjust_station_wifi_config(ap)
-            self.apply_wifi_config()
-            evt.result = True
-            evt.message = "New config file: {}\n"\
-                          .format(self.current_komondor_file)
+            self.stage_channel_switch(
+                evt.node, evt.new_channel_config,
+                old_channel_config=evt.old_channel_config)
+            (evt.result, evt.message) = self.commit_channel_switch()
+        finally:
+            self.__abort_channel_switch(transaction)
+            evt.set()
+
+    def handle_multi_channel_switch(self, evt):
+        aps = list(evt.new_channel_configs)
+        info("Sub6GhzEmulator: Node {} triggered channel switch of nodes "
+             "{}.\n".format(evt.node.name, [ap.name for ap in aps]))
+        transaction = self.begin_channel_switch()
+        try:
+            for ap in aps:
+                self.stage_channel_switch(
+                    ap, evt.new_channel_configs[ap],
+                    old_channel_config=evt.old_channel_configs.get(ap))
+            (evt.result, evt.message) = self.commit_channel_switch()
+        finally:
+            self.__abort_channel_switch(transaction)
             evt.set()
+
+    def begin_channel_switch(self):
+        '''
+        Starts a channel switch transaction. Blocks while another
+        transaction is in progress. The transaction holds the lock until
+        it has been committed or rolled back.
+        '''
+        self.channel_switch_lock.acquire()
+        self.channel_switch = ChannelSwitchTransaction()
+        return self.channel_switch
+
+    def stage_channel_switch(self, ap, channel_config,
+                             old_channel_config=None):
+        '''
+        Stages the new channel config of ap. Nothing is applied before
+        commit_channel_switch. old_channel_config is the config to roll
+        back to and defaults to the current config of ap.
+        '''
+        if self.channel_switch is None:
+            raise RuntimeError("No channel switch in progress.")
+        self.channel_switch.stage(ap, channel_config,
+                                  old_channel_config=old_channel_config)
+
+    def rollback_channel_switch(self):
+        '''
+        Discards the staged channel configs and restores the configs the
+        access points had before the transaction.
+        '''
+        transaction = self.__current_channel_switch()
+        try:
+            self.__set_channel_configs(transaction.old_channel_configs)
+        finally:
+            self.__end_channel_switch()
+
+    def commit_channel_switch(self):
+        '''
+        Applies all staged channel configs with a single config lookup and
+        a single pass over the links. If no result exists for the new
+        network config, all access points are rolled back. Returns a tuple
+        (success, message).
+        '''
+        transaction = self.__current_channel_switch()
+        try:
+            return self.__commit(transaction)
+        finally:
+            self.__end_channel_switch()
+
+    def __commit(self, transaction):
+        previous_file = self.current_komondor_file
+        self.__set_channel_configs(transaction.new_channel_configs)
+        try:
+            self.apply_wifi_config()
         except RuntimeError as err:
             error_message = """Sub6GhzEmulator: Error {}
                                Rolling back to previos config: {}.\n"""\
-                            .format(err, self.current_komondor_file)
+                            .format(err, previous_file)
             warn(error_message)
-            for node in (client_nodes + [ap]):
-                node.update_komondor_config(evt.old_channel_config)
-            self.apply_wifi_config()
-            evt.result = False
-            evt.message = error_message
-            evt.set()
+            self.__set_channel_configs(transaction.old_channel_configs)
+            # Links only have to be restored if they were changed
+            if self.current_komondor_file != previous_file:
+                self.apply_wifi_config()
+            transaction.finish()
+            return (False, error_message)
+        transaction.finish()
+        self.channel_switch_latency = transaction.latency
+        info("Sub6GhzEmulator: Switched channels of {} access points in "
+             "{:.3f} seconds.\n".format(len(transaction.new_channel_configs),
+                                        transaction.latency))
+        if self.pending_komondor_file:
+            return (True, "Simulating new config file: {}\n"
+                          .format(self.pending_komondor_file))
+        return (True, "New config file: {}\n"
+                      .format(self.current_komondor_file))
+
+    def __current_channel_switch(self):
+        transaction = self.channel_switch
+        if transaction is None:
+            raise RuntimeError("No channel switch in progress.")
+        return transaction
+
+    def __end_channel_switch(self):
+        self.channel_switch = None
+        self.channel_switch_lock.release()
+
+    def __abort_channel_switch(self, transaction):
+        # Staging failed before the transaction was committed
+        if self.channel_switch is transaction:
+            self.rollback_channel_switch()
+
+    def __set_channel_configs(self, channel_configs):
+        for ap, channel_config in channel_configs.items():
+            if ap.get_channel_config() != channel_config:
+                ap.update_komondor_config(channel_config)
+            self.adjust_station_wifi_config(ap)
 
     def handle_registration(self, evt):
         info("Sub6GhzEmulator: Registering node {}\n".format(evt.node.name))
@@ -99,7 +287,14 @@ class Sub6GhzEmulator(object):
     def apply_wifi_config(self):
         info("Sub6GhzEmulator: Trying to apply new network config.\n")
         new_config = self.wifi_config()
-        config_tuple = self.find_kommondor_config(new_config)
+        # On demand results are added from executor threads
+        with self.simulation_lock:
+            config_tuple = self.find_kommondor_config(new_config)
+        self.pending_komondor_file = None
+        if not config_tuple and self.lazy:
+            config_tuple = self.__simulate_on_demand(new_config)
+            if not config_tuple:
+                return
         if not config_tuple:
             warn("No config found for new network configs.\n")
             raise RuntimeError("Current config not found.")
@@ -107,16 +302,112 @@ class Sub6GhzEmulator(object):
             file_name = config_tuple[0]
             config = config_tuple[1]
 
-        self.current_komondor_file = file_name
-        self.current_komondor_config = self.komondor_configs[file_name]
-        self.current_komondor_result = self.komondor_results[file_name]
+        with self.simulation_lock:
+            self.current_komondor_file = file_name
+            self.current_komondor_config = self.komondor_configs[file_name]
+            self.current_komondor_result = self.komondor_results[file_name]
         info('Sub6GhzEmulator: Trying to apply new config file {}.\n'
              .format(file_name))
         self.apply_results()
         info("Sub6GhzEmulator: Network config {} successfully applied.\n"
              .format(config.cfg_file))
 
-    def apply_results(self):
+    def __simulate_on_demand(self, config):
+        '''
+        Simulates config, which is not cached yet, in the background. The
+        result is applied as soon as it is ready if the network still uses
+        config. Returns the config tuple if the interim policy waited for
+        the result, None if the links keep their current shaping.
+        '''
+        with self.simulation_lock:
+            fname = self.komondor_cache.add(config)
+            config.cfg_file = os.path.join(self.komondor_input_dir, fname)
+            if fname in self.komondor_configs:
+                # Added since the lookup
+                return (fname, self.komondor_configs[fname])
+            future = self.pending_simulations.get(fname)
+            submitted = future is None
+            if submitted:
+                info("Sub6GhzEmulator: Simulating config {} on demand.\n"
+                     .format(fname))
+                future = self.komondor_executor.submit(
+                    config.cfg_file, self.komondor_output_dir)
+                self.pending_simulations[fname] = future
+        if submitted:
+            future.add_done_callback(
+                partial(self.__on_demand_simulated, fname, config))
+        if self.interim_policy == "reject":
+            raise RuntimeError("Config {} is being simulated."
+                               .format(fname))
+        if self.interim_policy == "wait":
+            if not self.__add_on_demand_result(fname, config, future):
+                (_, err) = future.result()
+                raise RuntimeError("Simulation of config {} failed: {}"
+                                   .format(fname, err))
+            return (fname, config)
+        info("Sub6GhzEmulator: Keeping config {} until {} is simulated.\n"
+             .format(self.current_komondor_file, fname))
+        self.pending_komondor_file = fname
+        return None
+
+    def __on_demand_simulated(self, fname, config, future):
+        if not self.__add_on_demand_result(fname, config, future):
+            return
+        # Runs in a worker of the executor, which a channel switch holding
+        # the lock may be waiting for, so the result is applied elsewhere.
+        threading.Thread(target=self.__apply_on_demand_result,
+                         args=(fname, config), daemon=True).start()
+
+    def __apply_on_demand_result(self, fname, config):
+        with self.channel_switch_lock:
+            if self.wifi_config().fingerprint() != config.fingerprint():
+                # The network has moved on in the meantime
+                return
+            if self.current_komondor_file != fname:
+                self.apply_wifi_config()
+
+    def __add_on_demand_result(self, fname, config, future):
+        '''
+        Adds the result of the on demand simulation future of fname. Waits
+        for future and adds its result only once, the caller waiting for it
+        and the done callback both get whether it succeeded.
+        '''
+        (_, err) = future.result()
+        with self.simulation_lock:
+            if self.pending_simulations.get(fname) is not future:
+                # Added already
+                return fname in self.komondor_configs
+            del self.pending_simulations[fname]
+            if fname in self.komondor_configs:
+                return True
+            if err or not self.komondor_cache.add_result(fname):
+                warn("Sub6GhzEmulator: On demand simulation of {} failed: "
+                     "{}\n".format(fname, err))
+                failures = self.komondor_cache.read_failures()
+                failures[fname] = err
+                self.komondor_cache.write_failures(failures)
+                return False
+            self.komondor_configs[fname] = config
+            self.komondor_index.setdefault(config.fingerprint(), fname)
+            file_names = list(self.komondor_configs)
+            self.komondor_results = self.komondor_cache.store.results(
+                file_names)
+            self.komondor_cache.write_manifest(file_names)
+            return True
+
+    def apply_results(self, force=False):
+        '''
+        Shapes the WiFi links according to the current Komondor result.
+        Only interfaces whose rate or delay changed are reconfigured. The
+        tc commands of each node are run as a single tc batch if the
+        interfaces support it. With force all interfaces are configured
+        from scratch.
+        '''
+        if force:
+            self.link_shaping = {}
+        batches = collections.OrderedDict()
+        changed = 0
+        unchanged = 0
         for ap in self.net.access_points():
             stas = ap.connected_stations()
             for sta in stas:
@@ -124,16 +415,39 @@ class Sub6GhzEmulator(object):
                 result = self.current_komondor_result[komondor_name]
                 links = self.net.linksBetween(ap, sta)
                 for link in links:
-                    bw = int(result.getint("throughput") / 1000000)
+                    bw = int(result.throughput / 1000000)
                     # Dirty fix for ZeroDivisionError in mininet
                     if bw == 0:
                         bw = 1
-                    delay_value = result.get('delay')
-                    if delay_value in ['nan', '-nan']:
-                        delay_value = '0'
-                    delay = '{}ms'.format(round(float(delay_value)))
-                    link.intf1.config(bw=bw, delay=delay, use_tbf=True)
-                    link.intf2.config(bw=bw, delay=delay, use_tbf=True)
+                    delay_value = result.delay
+                    if math.isnan(delay_value):
+                        delay_value = 0
+                    delay = '{}ms'.format(round(delay_value))
+                    for intf in [link.intf1, link.intf2]:
+                        if self.link_shaping.get(intf) == (bw, delay):
+                            unchanged += 1
+                            continue
+                        self.__shape_intf(intf, bw, delay, batches)
+                        changed += 1
+        for batch in batches.values():
+            if batch.apply() != '':
+                # Unknown which commands failed, configure from scratch
+                for intf in batch.intfs:
+                    bw, delay = self.link_shaping.pop(intf)
+                    intf.config(bw=bw, delay=delay, use_tbf=True)
+                    self.link_shaping[intf] = (bw, delay)
+        info("Sub6GhzEmulator: Reconfigured {} interfaces with {} tc batches,"
+             " {} unchanged.\n".format(changed, len(batches), unchanged))
+
+    def __shape_intf(self, intf, bw, delay, batches):
+        if hasattr(intf, "shape"):
+            batch = batches.get(intf.node)
+            if batch is None:
+                batch = batches[intf.node] = TcBatch(intf.node)
+            intf.shape(bw, delay, batch=batch)
+        else:
+            intf.config(bw=bw, delay=delay, use_tbf=True)
+        self.link_shaping[intf] = (bw, delay)
 
     def wifi_config(self):
         config = KomondorConfig()
@@ -156,7 +470,54 @@ class Sub6GhzEmulator(object):
             sta.komondor_config.update(channel_params)
         return channel_params
 
-    def build_komondor(self, use_cache=True):
+    def build_komondor(self, use_cache=True,
+                       prune_symmetric=False,
+                       relabel_channels=False,
+                       decompose=False,
+                       lazy=False,
+                       neighbourhood=1,
+                       interim_policy="keep",
+                       horizons=None,
+                       keep_fraction=0.5,
+                       halving_objective="jainXtpt"):
+        '''
+        Simulates the channel combinations of the access points. With lazy
+        only the current channel assignment and the assignments differing
+        in the channels of at most neighbourhood access points are
+        simulated. Other configs are simulated on demand when the network
+        switches to them, interim_policy decides what happens meanwhile.
+
+        With horizons, a list of simulation times, the configs are
+        simulated by successive halving: all configs are simulated for the
+        shortest time, only the keep_fraction best by halving_objective
+        for the next one and so on, until the ranking of the remaining
+        configs does not change anymore. Every config is simulated with a
+        single seed, so horizons require komondor_seeds to be 1.
+
+        With prune_symmetric only one config of every set of configs that
+        access point symmetries map onto each other is simulated, the
+        results of the others are derived from it exactly. With
+        relabel_channels configs are also equivalent if a relabeling of
+        the basic channels within a band maps them onto each other. As
+        Komondor derives the path loss from the central frequency, derived
+        results are only approximations then: on HybridVirtualFiberTopo
+        throughputs deviate by up to 11% from simulated ones.
+        '''
+        if interim_policy not in self.__class__.INTERIM_POLICIES:
+            raise ValueError("Unknown interim policy {}."
+                             .format(interim_policy))
+        if halving_objective not in OBJECTIVES:
+            raise ValueError("Unknown objective {}."
+                             .format(halving_objective))
+        if horizons and self.komondor_seeds > 1:
+            raise ValueError("Successive halving simulates a single seed, "
+                             "it cannot be combined with {} seeds."
+                             .format(self.komondor_seeds))
+        self.lazy = lazy
+        self.interim_policy = interim_policy
+        self.horizons = sorted(horizons) if horizons else None
+        self.keep_fraction = keep_fraction
+        self.halving_objective = halving_objective
         configs = []
         access_points = self.net.access_points()
 
@@ -167,43 +528,268 @@ class Sub6GhzEmulator(object):
         for ap in access_points:
             self.adjust_station_wifi_config(ap)
 
-        channels = sorted([ ap.available_channels for ap in access_points ])
-        channel_combinations = list(itertools.product(*channels))
+        if lazy:
+            channel_combinations = self.__channel_neighbourhood(
+                access_points, neighbourhood)
+        else:
+            channels = [ap.available_channels for ap in access_points]
+            channel_combinations = list(itertools.product(*channels))
 
         for channels in channel_combinations:
             config = self.__build_channel_config(channels)
             configs.append(config)
 
-        cached_config_dict = read_komondor_configs(self.komondor_input_dir)
-        cached_configs = list(cached_config_dict.values())
-        if not use_cache or configs != cached_configs:
+        if not use_cache:
             info("Not using cached komondor config.\n")
             self.delete_cache()
-            self.write_komondor_configs(configs)
-            self.komondor_configs = read_komondor_configs(
-                self.komondor_input_dir)
-            info("Simulating komondor configurations. "
-                 "This might take a while.\n")
-            import time
+        self.komondor_cache.load()
+        config_map = self.write_komondor_configs(configs)
+        file_names = [fname for (fname, _) in config_map]
+        self.komondor_cache.write_manifest(file_names)
+        self.komondor_configs = collections.OrderedDict(config_map)
+
+        uncached = [fname for fname in file_names
+                    if not self.__is_cached(fname)]
+        if uncached:
+            components = [access_points]
+            if decompose:
+                components = self.interference_components()
             start = time.time()
-            self.presimulate()
+            if len(components) > 1:
+                failures = self.__simulate_components(
+                    components, uncached,
+                    prune_symmetric=prune_symmetric,
+                    relabel_channels=relabel_channels)
+            else:
+                failures = self.__simulate_configs(
+                    self.komondor_configs, uncached,
+                    prune_symmetric=prune_symmetric,
+                    relabel_channels=relabel_channels)
             end = time.time()
             time_elapsed = end - start
             info("Simulations finished."
                  "Time elapsed: {} seconds.\n".format(time_elapsed))
+            if failures:
+                warn("Sub6GhzEmulator: {} komondor simulations failed, "
+                     "see {}.\n".format(len(failures),
+                                        self.komondor_cache.FAILURES))
+                file_names = [fname for fname in file_names
+                              if fname not in failures]
+                self.komondor_cache.write_manifest(file_names)
+                for fname in failures:
+                    self.komondor_configs.pop(fname, None)
         else:
             info("Using cached komondor config.\n")
-            self.komondor_configs = cached_config_dict
-        self.komondor_results = read_komondor_results(
-            self.komondor_output_dir)
+        self.komondor_results = self.komondor_cache.store.results(file_names)
+        self.build_komondor_index()
         return self
 
-    def __build_channel_config(self, channels):
+    def __channel_neighbourhood(self, access_points, radius):
+        '''
+        Returns the current channel assignment of access_points and all
+        assignments changing the channels of at most radius of them.
+        '''
+        current = []
+        for ap in access_points:
+            cfg = ap.komondor_config
+            num = Channel.channel_num(cfg["min_channel_allowed"],
+                                      cfg["max_channel_allowed"])
+            current.append(Channel(num))
+        combinations = [tuple(current)]
+        for k in range(1, radius + 1):
+            for indices in itertools.combinations(range(len(current)), k):
+                alternatives = [[ch for ch in access_points[i]
+                                 .available_channels
+                                 if ch != current[i]] for i in indices]
+                for channels in itertools.product(*alternatives):
+                    combination = list(current)
+                    for i, channel in zip(indices, channels):
+                        combination[i] = channel
+                    combinations.append(tuple(combination))
+        return combinations
+
+    def interference_components(self):
+        '''
+        Splits the access points into groups that cannot interfere with
+        each other, based on node positions, transmit power, CCA threshold,
+        the path loss model and the available channels.
+        '''
+        access_points = self.net.access_points()
+        channels = [ap.available_channels[0] for ap in access_points]
+        config = self.__build_channel_config(channels)
+        available_channels = {ap.komondor_config.name: ap.available_channels
+                              for ap in access_points}
+        graph = interference_graph(config, available_channels)
+        aps_by_name = {ap.komondor_config.name: ap for ap in access_points}
+        return [[aps_by_name[name] for name in component]
+                for component in connected_components(graph)]
+
+    def __simulate_configs(self, configs, uncached,
+                           prune_symmetric=False,
+                           relabel_channels=False):
+        derived = {}
+        if prune_symmetric:
+            derived = self.__prune_symmetric(configs, uncached,
+                                             relabel_channels)
+        simulate = [fname for fname in uncached if fname not in derived]
+        info("Simulating {} of {} komondor configurations. "
+             "This might take a while.\n".format(len(simulate),
+                                                 len(configs)))
+        if self.horizons:
+            failures = self.__presimulate_halving(simulate)
+        else:
+            failures = self.presimulate(simulate)
+        failures.update(self.__derive_results(configs, derived, failures))
+        return failures
+
+    def __simulate_components(self, components, uncached,
+                              prune_symmetric=False,
+                              relabel_channels=False):
+        '''
+        Simulates the channel combinations of each component separately and
+        composes the results of the uncached configs from the results of
+        their components.
+        '''
+        info("Sub6GhzEmulator: Splitting {} access points into {} "
+             "independent groups.\n".format(len(self.net.access_points()),
+                                            len(components)))
+        failures = {}
+        component_nodes = []
+        for component in components:
+            channels = [ap.available_channels for ap in component]
+            configs = [self.__build_channel_config(x, access_points=component)
+                       for x in itertools.product(*channels)]
+            configs = collections.OrderedDict(
+                self.write_komondor_configs(configs))
+            component_uncached = [
+                fname for fname in configs
+                if not self.__is_cached(fname)]
+            if component_uncached:
+                failures.update(self.__simulate_configs(
+                    configs, component_uncached,
+                    prune_symmetric=prune_symmetric,
+                    relabel_channels=relabel_channels))
+            nodes = []
+            for ap in component:
+                nodes.append(ap.komondor_config.name)
+                nodes += [sta.komondor_config.name
+                          for sta in ap.connected_stations()]
+            component_nodes.append(nodes)
+
+        results = {}
+        for fname in uncached:
+            config = self.komondor_configs[fname]
+            composed = KomondorStats()
+            sources = []
+            for nodes in component_nodes:
+                sub_config = self.__sub_config(config, nodes)
+                sub_fname = self.komondor_cache.file_name(sub_config)
+                if sub_fname in failures or not sub_fname:
+                    failures[fname] = \
+                        "Simulation of component config {} failed."\
+                        .format(sub_fname)
+                    break
+                if sub_fname not in results:
+                    results[sub_fname] = KomondorStats(
+                        os.path.join(self.komondor_output_dir, sub_fname))
+                composed.update(results[sub_fname])
+                sources.append(sub_fname)
+            else:
+                self.komondor_cache.write_result(
+                    fname, composed, horizon=self.__source_horizon(sources),
+                    wlan_stats=self.__source_wlan_stats(
+                        composed, [(x, {}) for x in sources]))
+        return failures
+
+    def __sub_config(self, config, nodes):
+        config_dict = collections.OrderedDict()
+        config_dict["System"] = config["System"]
+        for node in nodes:
+            config_dict[node] = config[node]
+        sub_config = KomondorConfig()
+        sub_config.read_dict(config_dict)
+        return sub_config
+
+    def __prune_symmetric(self, configs, uncached, relabel_channels=False):
+        '''
+        Maps uncached configs to an equivalent representative config.
+        Configs with a cached result are preferred as representatives.
+        Returns a dict of the configs that do not need a simulation.
+        '''
+        uncached = set(uncached)
+        fnames = [fname for fname in configs if fname not in uncached]
+        fnames += [fname for fname in configs if fname in uncached]
+        config_list = [configs[fname] for fname in fnames]
+        adjacent_channel_model = \
+            int(self.komondor_system_cfg["adjacent_channel_model"])
+        symmetries = komondor_symmetries(config_list[0])
+        relabel_channels = relabel_channels and adjacent_channel_model == 0
+        mapping = canonical_representatives(config_list, symmetries,
+                                            relabel_channels=relabel_channels)
+        derived = {}
+        for fname, (i, node_map) in zip(fnames, mapping):
+            if fname in uncached and fnames[i] != fname:
+                derived[fname] = (fnames[i], node_map)
+        info("Sub6GhzEmulator: {} access point symmetries found. "
+             "{} of {} uncached configs are equivalent to another config.\n"
+             .format(len(symmetries), len(derived), len(uncached)))
+        return derived
+
+    def __derive_results(self, configs, derived, failures):
+        derived_failures = {}
+        for fname, (representative, node_map) in derived.items():
+            if representative in failures:
+                derived_failures[fname] = \
+                    "Simulation of equivalent config {} failed."\
+                    .format(representative)
+                continue
+            result = KomondorStats(
+                os.path.join(self.komondor_output_dir, representative))
+            mapped = map_komondor_result(result, node_map, configs[fname])
+            wlan_map = {result[node_map.get(x.name, x.name)].wlan: x.wlan
+                        for x in mapped}
+            self.komondor_cache.write_result(
+                fname, mapped,
+                horizon=self.__source_horizon([representative]),
+                wlan_stats=self.__source_wlan_stats(
+                    mapped, [(representative, wlan_map)]))
+        return derived_failures
+
+    def __source_horizon(self, sources):
+        '''
+        Returns the horizon of a result derived from the results of
+        sources: the shortest simulation time among them, None if all were
+        simulated for the default time.
+        '''
+        horizons = [self.komondor_cache.store.horizon(x) for x in sources]
+        if all(x is None for x in horizons):
+            return None
+        default = self.komondor_args.get("time", 100)
+        return min(default if x is None else x for x in horizons)
+
+    def __source_wlan_stats(self, result, sources):
+        '''
+        Returns the per WLAN seed statistics of a result derived from the
+        results of sources, (fname, wlan_map) tuples mapping the WLANs of
+        fname to the WLANs of result. None unless the sources cover every
+        WLAN of result with statistics of several seeds.
+        '''
+        summaries = []
+        for source, wlan_map in sources:
+            for _, summary in self.komondor_cache.store.wlan_stats(source):
+                summaries.append(summary.copy(
+                    wlan=wlan_map.get(summary.wlan, summary.wlan)))
+        if sorted(x.wlan for x in summaries) != result.wlans():
+            return None
+        return summaries
+
+    def __build_channel_config(self, channels, access_points=None):
+        if access_points is None:
+            access_points = self.net.access_points()
         config_dict = collections.OrderedDict()
         config_dict["System"] = collections.OrderedDict(
             **self.komondor_system_cfg)
-        for i, ap in enumerate(self.net.access_points()):
-            channel = channels[i]
+        for ap, channel in zip(access_points, channels):
             cfg = self.__build_bss_config(ap, channel)
             config_dict.update(cfg)
         config = KomondorConfig()
@@ -230,34 +816,240 @@ class Sub6GhzEmulator(object):
 
     def write_komondor_configs(self, configs):
         config_map = []
-        max_digits = int(math.log10(len(configs))) + 1
-        for i, config in enumerate(configs):
-            suffix = format(i, "0{}".format(max_digits))
-            fname = "{}.cfg".format(suffix)
-            fpath = os.path.join(self.komondor_input_dir, fname)
-            with open(fpath, 'w') as f:
-                config.write(f)
+        for config in configs:
+            fname = self.komondor_cache.add(config)
+            config.cfg_file = os.path.join(self.komondor_input_dir, fname)
             config_map.append((fname, config))
         return config_map
 
-    def presimulate(self):
-        cfg_files = [os.path.join(self.komondor_input_dir, f)
-                     for f in os.listdir(self.komondor_input_dir)
-                     if f.endswith(".cfg")]
-        pool = multiprocessing.Pool()
+    def presimulate(self, cfg_files=None, resume=True, horizon=None):
+        '''
+        Simulates the given config files of the input directory and returns
+        a dict of failed config files and their errors. Failed simulations
+        do not stop the remaining ones, they are recorded in the failure
+        manifest of the cache. With resume, configs with a valid result
+        from a previous (interrupted) run are skipped. horizon overrides
+        the simulation time and is recorded with the results, it cannot be
+        combined with several seeds.
+        '''
+        if horizon is not None and self.komondor_seeds > 1:
+            raise ValueError("A horizon cannot be combined with {} seeds."
+                             .format(self.komondor_seeds))
+        if cfg_files is None:
+            cfg_files = [f for f in os.listdir(self.komondor_input_dir)
+                         if f.endswith(".cfg")]
+        if resume:
+            cfg_files = [f for f in cfg_files
+                         if not self.__is_cached(f)]
+        failures = self.komondor_cache.read_failures()
+        total = len(cfg_files)
+        done = 0
+        failed = {}
+        start = time.time()
+
+        if horizon is not None:
+            runs = self.__simulate_horizon(cfg_files, horizon)
+        elif self.komondor_seeds > 1:
+            runs = self.__simulate_seeds(cfg_files)
+        else:
+            runs = self.__simulate(cfg_files)
+        for (fname, err) in runs:
+            done += 1
+            if err:
+                failed[fname] = err
+                failures[fname] = err
+                warn("Sub6GhzEmulator: Simulation of {} failed: {}\n"
+                     .format(fname, err))
+            else:
+                failures.pop(fname, None)
+            elapsed = time.time() - start
+            eta = elapsed / done * (total - done)
+            info("Sub6GhzEmulator: Simulated {}/{} configs "
+                 "({} failed). ETA: {:.0f} seconds.\n"
+                 .format(done, total, len(failed), eta))
+            # Keep the failure manifest current in case of a crash
+            if err:
+                self.komondor_cache.write_failures(failures)
+        self.komondor_cache.write_failures(failures)
+        return failed
+
+    def __presimulate_halving(self, cfg_files):
+        '''
+        Successive halving over self.horizons, returns the failed configs
+        like presimulate.
+        '''
+        candidates = list(cfg_files)
+        failed = {}
+        ranking = None
+        for i, horizon in enumerate(self.horizons):
+            info("Sub6GhzEmulator: Simulating {} configs for {} seconds.\n"
+                 .format(len(candidates), horizon))
+            failed.update(self.presimulate(candidates, resume=False,
+                                           horizon=horizon))
+            candidates = [f for f in candidates if f not in failed]
+            if i == len(self.horizons) - 1 or len(candidates) < 2:
+                break
+            previous = ranking
+            ranking = self.__rank_configs(candidates)
+            if previous and ranking == [f for f in previous
+                                        if f in ranking]:
+                info("Sub6GhzEmulator: Ranking of {} configs is stable "
+                     "after {} seconds.\n".format(len(candidates), horizon))
+                break
+            keep = max(1, math.ceil(len(ranking) * self.keep_fraction))
+            candidates = ranking[:keep]
+        return failed
+
+    def __rank_configs(self, fnames):
+        '''
+        Sorts fnames by halving_objective of their results, best first. All
+        WLANs are weighted with a single customer.
+        '''
+        store = self.komondor_cache.store
+        rows = {fname: i for i, fname in enumerate(fnames)}
+        wlans = {}
+        throughputs = collections.defaultdict(dict)
+        for fname, wlan, throughput in store.wlan_throughputs():
+            if fname in rows:
+                wlans.setdefault(wlan, len(wlans))
+                throughputs[fname][wlan] = throughput
+        matrix = np.zeros((len(fnames), len(wlans)))
+        for fname, wlan_throughputs in throughputs.items():
+            for wlan, throughput in wlan_throughputs.items():
+                matrix[rows[fname], wlans[wlan]] = throughput
+        objective = OBJECTIVES[self.halving_objective]
+        scores = objective(matrix, np.ones(len(wlans)))[
+            self.halving_objective]
+        order = sorted(range(len(fnames)), key=lambda i: -scores[i])
+        return [fnames[i] for i in order]
+
+    def __is_cached(self, fname):
+        if not self.komondor_cache.has_valid_result(fname):
+            return False
+        horizon = self.komondor_cache.store.horizon(fname)
+        if not self.horizons:
+            # Pruned by successive halving, simulate it for the full time
+            if horizon is not None and \
+                    horizon < self.komondor_args.get("time", 100):
+                return False
+        if horizon is not None:
+            # Successive halving simulates a single seed
+            return True
+        if self.komondor_seeds > 1:
+            return self.komondor_cache.store.samples(fname) >= \
+                self.komondor_seeds
+        return True
+
+    def __simulate(self, cfg_files):
+        paths = [os.path.join(self.komondor_input_dir, x) for x in cfg_files]
+        for (cfg_file, err) in self.komondor_executor.run(
+                paths, self.komondor_output_dir):
+            fname = os.path.basename(cfg_file)
+            if not err:
+                self.komondor_cache.add_result(fname)
+            yield (fname, err)
 
-        f = partial(run_komondor_worker,
-                    output_dir=self.komondor_output_dir)
-        pool.map(f, cfg_files)
+    def __simulate_horizon(self, cfg_files, horizon):
+        paths = [os.path.join(self.komondor_input_dir, x) for x in cfg_files]
+        for (cfg_file, err) in self.komondor_executor.run(
+                paths, self.komondor_cache.horizon_dir(horizon),
+                time=horizon):
+            fname = os.path.basename(cfg_file)
+            if not err and not \
+                    self.komondor_cache.add_horizon_result(fname, horizon):
+                err = "Invalid result."
+            yield (fname, err)
+
+    def __simulate_seeds(self, cfg_files):
+        '''
+        Simulates every config with komondor_seeds seeds in parallel. While
+        the confidence interval of a WLAN throughput is wider than
+        komondor_precision of its mean, another batch of seeds is added up
+        to komondor_max_seeds. Seeds with a result from a previous run are
+        not simulated again. Yields (fname, error) once a config is done.
+        '''
+        base_seed = self.komondor_args.get("seed", 1)
+        max_seeds = max(self.komondor_max_seeds or 0, self.komondor_seeds)
+        futures = {}
+        seeds = collections.Counter()
+        pending = collections.Counter()
+        existing = {}
+        errors = {}
+        # Configs whose seeds are all simulated
+        ready = []
+
+        def submit(fname, count):
+            path = os.path.join(self.komondor_input_dir, fname)
+            while count > 0:
+                seed = base_seed + seeds[fname]
+                seeds[fname] += 1
+                if seed in existing[fname]:
+                    continue
+                future = self.komondor_executor.submit(
+                    path, self.komondor_cache.seed_dir(seed), seed=seed)
+                futures[future] = fname
+                pending[fname] += 1
+                count -= 1
+
+        for fname in cfg_files:
+            existing[fname] = set(self.komondor_cache.seeds(fname))
+            missing = self.komondor_seeds - len(existing[fname])
+            if missing > 0:
+                submit(fname, missing)
+            else:
+                ready.append(fname)
+        try:
+            while futures or ready:
+                for fname in ready:
+                    seed_stats = self.komondor_cache.aggregate_seeds(fname)
+                    if seed_stats is None:
+                        yield (fname, "No valid result of any seed.")
+                    elif (seed_stats.samples < max_seeds and
+                          not seed_stats.converged(self.komondor_precision)):
+                        submit(fname, min(self.komondor_seeds,
+                                          max_seeds - seed_stats.samples))
+                    else:
+                        yield (fname, None)
+                ready = []
+                if not futures:
+                    break
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    fname = futures.pop(future)
+                    (_, err) = future.result()
+                    if err:
+                        errors.setdefault(fname, err)
+                    pending[fname] -= 1
+                    if pending[fname]:
+                        continue
+                    if fname in errors:
+                        yield (fname, errors[fname])
+                        continue
+                    ready.append(fname)
+        finally:
+            # The consumer stopped early, drop the remaining jobs
+            for future in futures:
+                future.cancel()
 
     def delete_cache(self):
-        for d in [self.komondor_input_dir, self.komondor_output_dir]:
-            for f in os.listdir(d):
-                if f.endswith(".cfg"):
-                    os.remove(os.path.join(d, f))
+        self.komondor_cache.clear()
 
-    def find_kommondor_config(self, config):
+    def build_komondor_index(self):
+        '''
+        Indexes the komondor configs by fingerprint, so looking up the
+        config of the current network does not depend on the cache size.
+        Like the former linear scan, the first of equal configs is found.
+        '''
+        self.komondor_index = {}
         for fname, cfg in self.komondor_configs.items():
-            if cfg == config:
-                return (fname, cfg)
-        return None
+            self.komondor_index.setdefault(cfg.fingerprint(), fname)
+        return self.komondor_index
+
+    def find_kommondor_config(self, config):
+        if self.komondor_index is None:
+            self.build_komondor_index()
+        fname = self.komondor_index.get(config.fingerprint())
+        if not fname:
+            return None
+        return (fname, self.komondor_configs[fname])
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+'''
+Microbenchmarks of the Komondor and controller hot paths, comparing the
+former implementations with the current ones.
+
+    python tests/benchmark.py [benchmark ...]
+
+Runs all benchmarks if none is given. Times are the best of several
+repetitions, so they are comparable between runs on the same machine.
+'''
+import os
+import sys
+import glob
+import types
+import random
+import socket
+import struct
+import timeit
+import argparse
+import collections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from terranet.wifi.komondor_config import (  # noqa: E402
+    KomondorConfig, KomondorResult)
+from terranet.wifi.komondor_stats import KomondorStats  # noqa: E402
+from terranet.ryu.app.packet_headers import (  # noqa: E402
+    PacketHeaders, packet_headers)
+from terranet.ryu.app import ipv6_address_helper  # noqa: E402
+from terranet.ryu.app.ipv6_address_helper import (  # noqa: E402
+    IPv6AddressHelper)
+from reference_ipv6_address_helper import (  # noqa: E402
+    IPv6AddressHelper as ReferenceIPv6AddressHelper)
+
+
+KOMONDOR_DIR = os.path.join(ROOT, "terranet", "topo", ".komondor")
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def best_time(fn, number=1, repeat=5):
+    '''
+    Returns the best time per call of fn in seconds.
+    '''
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.1f} {}".format(seconds / scale, unit)
+    return "{:.2f} us".format(seconds / 1e-6)
+
+
+def read_configs(topo):
+    files = sorted(glob.glob(os.path.join(KOMONDOR_DIR, topo, "input",
+                                          "*.cfg")))
+    return [KomondorConfig(f) for f in files]
+
+
+@benchmark
+def fingerprint():
+    '''
+    Looking up the config of the network among n cached configs: the
+    linear scan comparing it with every config vs the fingerprint index.
+    The match is the last config. Larger caches are copies of the
+    HybridVirtualFiberTopo configs differing in the noise level.
+    '''
+    configs = read_configs("HybridVirtualFiberTopo")
+    print("  configs   linear scan   index lookup")
+    for copies in (1, 4, 16):
+        cached = collections.OrderedDict()
+        for i in range(copies):
+            for j, config in enumerate(configs):
+                cfg = KomondorConfig()
+                cfg.read_dict(config)
+                cfg["System"]["noise_level"] = str(-95 - copies + 1 + i)
+                cached["{:02d}_{:03d}.cfg".format(i, j)] = cfg
+        query = KomondorConfig()
+        query.read_dict(cfg)
+
+        def linear_scan():
+            for fname, cfg in cached.items():
+                if cfg == query:
+                    return (fname, cfg)
+            return None
+
+        index = {}
+        for fname, cfg in cached.items():
+            index.setdefault(cfg.fingerprint(), fname)
+
+        def index_lookup():
+            fname = index.get(query.fingerprint())
+            return (fname, cached[fname])
+
+        assert linear_scan() == index_lookup()
+        print("  {:7d}   {:>11}   {:>12}".format(
+            len(cached), format_time(best_time(linear_scan, repeat=3)),
+            format_time(best_time(index_lookup, number=100))))
+
+
+@benchmark
+def stats():
+    '''
+    Parsing and aggregating n Komondor result files, KomondorResult vs
+    KomondorStats. The result files of the topology caches are read
+    repeatedly.
+    '''
+    files = sorted(glob.glob(os.path.join(KOMONDOR_DIR, "*", "output",
+                                          "*.cfg")))
+    files = [files[i % len(files)] for i in range(5000)]
+
+    def aggregate(cls):
+        totals = []
+        for path in files:
+            result = cls(path)
+            totals.append((result.total_throughput(),
+                           [(x, result.wlan_throughput(x))
+                            for x in result.wlans()]))
+        return totals
+
+    assert aggregate(KomondorResult) == aggregate(KomondorStats)
+    print("    files   KomondorResult   KomondorStats")
+    print("  {:7d}   {:>14}   {:>13}".format(
+        len(files),
+        format_time(best_time(lambda: aggregate(KomondorResult), repeat=3)),
+        format_time(best_time(lambda: aggregate(KomondorStats), repeat=3))))
+
+
+def ryu_packet_lib():
+    # os-ken is the maintained fork of ryu with the same packet library
+    for name in ("ryu", "os_ken"):
+        try:
+            return __import__(name + ".lib.packet", fromlist=[
+                "packet", "ethernet", "ipv6"])
+        except ImportError:
+            continue
+    return None
+
+
+@benchmark
+def packet_in():
+    '''
+    Extracting the addresses of a 118 byte Ethernet/IPv6/ICMPv6 packet in,
+    ryu's packet.Packet vs PacketHeaders. The customer table path looks
+    the headers up three times per packet in.
+    '''
+    src = socket.inet_pton(socket.AF_INET6, "fd00::8101:8001:0:0:2")
+    dst = socket.inet_pton(socket.AF_INET6, "fd00::8101:0:0:0:1")
+    icmp = struct.pack("!BBHHH", 128, 0, 0, 1, 1) + bytes(56)
+    data = (bytes.fromhex("0a00000000010a00000000ff86dd")
+            + struct.pack("!IHBB16s16s", 6 << 28, len(icmp), 58, 64, src,
+                          dst)
+            + icmp)
+    assert len(data) == 118
+
+    def customer_table_path():
+        msg = types.SimpleNamespace(data=data)
+        return [(packet_headers(msg).ipv6_src, packet_headers(msg).ipv6_dst)
+                for _ in range(3)]
+
+    timings = [("PacketHeaders", lambda: PacketHeaders(data),
+                customer_table_path)]
+    lib = ryu_packet_lib()
+    if lib is None:
+        print("  ryu's packet library is not installed, skipping "
+              "packet.Packet")
+    else:
+        def packet_ipv6():
+            return lib.packet.Packet(data).get_protocols(lib.ipv6.ipv6)[0]
+
+        def packet_customer_table_path():
+            return [(ip.src, ip.dst) for ip in (packet_ipv6()
+                                                for _ in range(3))]
+
+        pkt = lib.packet.Packet(data)
+        eth = pkt.get_protocols(lib.ethernet.ethernet)[0]
+        headers = PacketHeaders(data)
+        assert (headers.eth_src, headers.ipv6_src, headers.ipv6_dst) == \
+            (eth.src, packet_ipv6().src, packet_ipv6().dst)
+        timings.insert(0, ("packet.Packet", packet_ipv6,
+                           packet_customer_table_path))
+    print("  parser          single parse   customer table path")
+    for name, single, path in timings:
+        print("  {:13}   {:>12}   {:>19}".format(
+            name, format_time(best_time(single, number=10000)),
+            format_time(best_time(path, number=10000))))
+
+
+def customer_addresses(count, seed=25):
+    rng = random.Random(seed)
+    return ["fd00::{:x}:{:x}:0:0:{:x}".format(
+                rng.randrange(0x8000, 0x9000), rng.getrandbits(16),
+                rng.getrandbits(16))
+            for _ in range(count)]
+
+
+def cold_time(fn, repeat=5):
+    '''
+    Returns the best time of fn starting with an empty decode cache.
+    '''
+    times = []
+    for _ in range(repeat):
+        ipv6_address_helper._decode.cache_clear()
+        times.append(timeit.timeit(fn, number=1))
+    return min(times)
+
+
+@benchmark
+def ipv6_address():
+    '''
+    IPv6AddressHelper before and after decoding addresses once to an int
+    and caching the fields. Single lookups of fd00::8101:8001:0:0:2, the
+    5 lookups of a customer packet in and the subnet prefixes of 1000
+    inventory addresses.
+    '''
+    ip = "fd00::8101:8001:0:0:2"
+    addresses = customer_addresses(1000)
+    print("  lookup                    reference       cached     uncached")
+    for method in ("is_customer_address", "distribution_id",
+                   "subnet_prefix", "client_id"):
+        reference = getattr(ReferenceIPv6AddressHelper, method)
+        current = getattr(IPv6AddressHelper, method)
+        assert reference(ip) == current(ip)
+        print("  {:20}   {:>12}   {:>10}   {:>10}".format(
+            method, format_time(best_time(lambda: reference(ip),
+                                          number=1000)),
+            format_time(best_time(lambda: current(ip), number=10000)),
+            format_time(cold_time(lambda: [current(x) for x in addresses])
+                        / len(addresses))))
+
+    def packet_in(helper):
+        src = "fd00::8101:8001:0:0:2"
+        dst = "fd00::8102:8001:0:0:3"
+        return (helper.is_customer_address(src),
+                helper.is_customer_address(dst),
+                helper.subnet_prefix(src),
+                helper.distribution_id(src),
+                helper.client_id(src))
+
+    assert packet_in(ReferenceIPv6AddressHelper) == \
+        packet_in(IPv6AddressHelper)
+    print("  {:20}   {:>12}   {:>10}".format(
+        "5 lookups packet in",
+        format_time(best_time(lambda: packet_in(ReferenceIPv6AddressHelper),
+                              number=1000)),
+        format_time(best_time(lambda: packet_in(IPv6AddressHelper),
+                              number=10000))))
+
+    def decode_many():
+        return [x.subnet_prefix
+                for x in IPv6AddressHelper.decode_many(addresses)]
+
+    assert decode_many() == [ReferenceIPv6AddressHelper.subnet_prefix(x)
+                             for x in addresses]
+    print("  {:20}   {:>12}   {:>10}   {:>10}".format(
+        "1000 subnet prefixes",
+        format_time(best_time(lambda: [
+            ReferenceIPv6AddressHelper.subnet_prefix(x) for x in addresses],
+            repeat=3)),
+        format_time(best_time(decode_many, number=10)),
+        format_time(cold_time(decode_many))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help="one of {}, all by default".format(
+                            ", ".join(BENCHMARKS)))
+    args = parser.parse_args()
+    unknown = [x for x in args.benchmarks if x not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks {}".format(", ".join(unknown)))
+    for name in args.benchmarks or BENCHMARKS:
+        fn = BENCHMARKS[name]
+        print("{}: {}".format(name, " ".join(fn.__doc__.split())))
+        fn()
+        print()
+
+
+if __name__ == "__main__":
+    main()
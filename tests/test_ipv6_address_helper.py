@@ -0,0 +1,89 @@
+import random
+import ipaddress
+
+import pytest
+
+from terranet.ryu.app.ipv6_address_helper import IPv6AddressHelper
+from reference_ipv6_address_helper import IPv6AddressHelper as \
+    ReferenceIPv6AddressHelper
+
+
+METHODS = ["parse_address", "prefix", "subnet_id", "subnet_prefix",
+           "interface_id", "distribution_id", "client_id",
+           "distribution_net", "client_net", "customer_net",
+           "is_customer_address"]
+
+
+def random_addresses(count, seed=25):
+    rng = random.Random(seed)
+    addresses = []
+    for i in range(count):
+        words = [rng.choice([0, rng.getrandbits(16)]) for _ in range(8)]
+        if i % 2:
+            # Client and customer addresses of the topologies, fd00::/48
+            # with the distribution and client id as subnet
+            words[:4] = [0xfd00, 0, 0, (rng.randrange(0x80, 0x90) << 8)
+                         | rng.getrandbits(8)]
+            words[4] |= rng.choice([0, 0x8000])
+        address = ipaddress.IPv6Address(
+            int.from_bytes(b"".join(x.to_bytes(2, "big") for x in words),
+                           "big"))
+        # Compressed, exploded and IPv6Address inputs
+        addresses.append(rng.choice([str(address), address.exploded,
+                                     address]))
+    return addresses
+
+
+def outcome(helper, method, ip):
+    try:
+        return getattr(helper, method)(ip)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.fixture(scope="module")
+def addresses():
+    return random_addresses(5000)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_method_equals_reference(method, addresses):
+    for ip in addresses:
+        value = getattr(IPv6AddressHelper, method)(ip)
+        expected = getattr(ReferenceIPv6AddressHelper, method)(ip)
+        assert value == expected, ip
+        assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize("ip", [
+    "fd00::8101:8001:0:0:2", "fd00::8101:0:0:0:1", "FD00:0:0:8101::1",
+    "::", "::1", "::ffff:10.0.0.1", "fe80::1%eth0", "fd00::1%2",
+    "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff",
+])
+@pytest.mark.parametrize("method", METHODS)
+def test_edge_cases_equal_reference(method, ip):
+    assert (outcome(IPv6AddressHelper, method, ip)
+            == outcome(ReferenceIPv6AddressHelper, method, ip))
+
+
+@pytest.mark.parametrize("ip", [
+    "", " fd00::1", "fd00::1 ", "fd00::g", "fd00:::1", "fd00::1::2",
+    "1:2:3:4:5:6:7:8:9", "10.0.0.1", "fd00::1/64", None, 1,
+])
+@pytest.mark.parametrize("method", METHODS)
+def test_invalid_raises_like_reference(method, ip):
+    error = outcome(ReferenceIPv6AddressHelper, method, ip)
+    assert isinstance(error, type) and issubclass(error, Exception)
+    assert outcome(IPv6AddressHelper, method, ip) is error
+
+
+def test_decode_many(addresses):
+    ips = addresses[:1000] * 2
+    fields = IPv6AddressHelper.decode_many(ips)
+    assert len(fields) == len(ips)
+    for ip, field in zip(ips, fields):
+        assert field == IPv6AddressHelper.decode(ip)
+        assert field.subnet_prefix == \
+            ReferenceIPv6AddressHelper.subnet_prefix(ip)
+        assert field.is_customer == \
+            ReferenceIPv6AddressHelper.is_customer_address(ip)
@@ -0,0 +1,118 @@
+import os
+import glob
+import random
+import collections
+
+import pytest
+
+from terranet.wifi.komondor_config import KomondorConfig
+
+
+KOMONDOR_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "terranet", "topo", ".komondor")
+TOPOLOGIES = ["HybridVirtualFiberTopo", "HybridBackupTerragraphTopo"]
+
+
+def read_configs(topo):
+    files = sorted(glob.glob(os.path.join(KOMONDOR_DIR, topo, "input",
+                                          "*.cfg")))
+    return collections.OrderedDict((os.path.basename(f), KomondorConfig(f))
+                                   for f in files)
+
+
+def linear_scan(configs, config):
+    # find_kommondor_config before the fingerprint index
+    for fname, cfg in configs.items():
+        if cfg == config:
+            return (fname, cfg)
+    return None
+
+
+def index_lookup(configs, config):
+    try:
+        from terranet.wifi.sub6ghz_emulator import Sub6GhzEmulator
+    except ImportError:
+        pytest.skip("Sub6GhzEmulator needs mininet")
+    emulator = Sub6GhzEmulator.__new__(Sub6GhzEmulator)
+    emulator.komondor_configs = configs
+    emulator.komondor_index = None
+    return emulator.find_kommondor_config(config)
+
+
+def copy_config(config):
+    copy = KomondorConfig()
+    copy.read_dict(config)
+    return copy
+
+
+def reordered_config(config):
+    copy = KomondorConfig()
+    for section in reversed(config.sections()):
+        copy.add_section(section)
+        for key, value in reversed(list(config[section].items())):
+            copy[section][key] = value
+    return copy
+
+
+@pytest.fixture(scope="module", params=TOPOLOGIES)
+def configs(request):
+    configs = read_configs(request.param)
+    if not configs:
+        pytest.skip("No Komondor configs of {}".format(request.param))
+    return configs
+
+
+@pytest.fixture(scope="module")
+def queries(configs):
+    rng = random.Random(5)
+    fnames = list(configs)
+    return [fnames[0], fnames[-1]] + rng.sample(fnames, 4)
+
+
+def test_fingerprint_ignores_order(configs, queries):
+    for fname in queries:
+        config = configs[fname]
+        reordered = reordered_config(config)
+        assert reordered == config
+        assert reordered.fingerprint() == config.fingerprint()
+
+
+def test_fingerprint_matches_equality(configs, queries):
+    for fname in queries:
+        config = configs[fname]
+        for other in configs.values():
+            assert ((other.fingerprint() == config.fingerprint())
+                    == (other == config))
+
+
+def test_fingerprint_sees_every_option(configs, queries):
+    config = configs[queries[0]]
+    for section in config.sections():
+        for key, value in config[section].items():
+            changed = copy_config(config)
+            changed[section][key] = value + "0"
+            assert changed.fingerprint() != config.fingerprint()
+
+
+def test_lookup_equals_linear_scan(configs, queries):
+    for fname in queries:
+        query = copy_config(configs[fname])
+        assert index_lookup(configs, query) == linear_scan(configs, query)
+        assert index_lookup(configs, query)[0] == fname
+
+
+def test_lookup_misses_like_linear_scan(configs, queries):
+    query = copy_config(configs[queries[-1]])
+    ap = query.access_points()[0]
+    ap["primary_channel"] = "-1"
+    assert linear_scan(configs, query) is None
+    assert index_lookup(configs, query) is None
+
+
+def test_lookup_finds_first_duplicate(configs, queries):
+    fname = queries[-1]
+    duplicated = collections.OrderedDict(configs)
+    duplicated["duplicate.cfg"] = copy_config(configs[fname])
+    duplicated.move_to_end(fname)
+    query = copy_config(configs[fname])
+    assert index_lookup(duplicated, query) == linear_scan(duplicated, query)
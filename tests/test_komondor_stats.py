@@ -0,0 +1,89 @@
+import io
+import os
+import glob
+import math
+
+import pytest
+
+from terranet.wifi.komondor_config import KomondorResult
+from terranet.wifi.komondor_stats import KomondorStats
+
+
+KOMONDOR_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "terranet", "topo", ".komondor")
+RESULT_FILES = sorted(glob.glob(os.path.join(KOMONDOR_DIR, "*", "output",
+                                             "*.cfg")))
+
+
+def stats_valid(path):
+    # The cache treats files KomondorStats fails to parse as invalid
+    try:
+        return KomondorStats(path).is_valid()
+    except ValueError:
+        return False
+
+
+def assert_equivalent(stats, result):
+    assert stats.sections() == result.sections()
+    assert stats.wlans() == result.wlans()
+    assert stats.total_throughput() == result.total_throughput()
+    for wlan in result.wlans():
+        assert stats.wlan_throughput(wlan) == result.wlan_throughput(wlan)
+        assert ([x.name for x in stats.nodes_by_wlan(wlan)]
+                == [x.name for x in result.nodes_by_wlan(wlan)])
+    for name in result.sections():
+        node = stats[name]
+        assert node.wlan == result[name]["wlan"]
+        assert node.throughput == int(result[name]["throughput"])
+        delay = float(result[name]["delay"])
+        # Komondor writes -nan for stations without traffic
+        assert (node.delay == delay
+                or (math.isnan(node.delay) and math.isnan(delay)))
+    assert stats.is_valid() == result.is_valid()
+
+
+def test_result_files_shipped():
+    assert RESULT_FILES
+
+
+@pytest.mark.parametrize("path", RESULT_FILES,
+                         ids=lambda x: os.path.relpath(x, KOMONDOR_DIR))
+def test_stats_equal_result(path):
+    assert_equivalent(KomondorStats(path), KomondorResult(path))
+
+
+@pytest.mark.parametrize("path", RESULT_FILES[::50],
+                         ids=lambda x: os.path.relpath(x, KOMONDOR_DIR))
+def test_write_round_trip(path, tmp_path):
+    stats = KomondorStats(path)
+    written = tmp_path / "result.cfg"
+    with open(str(written), "w") as f:
+        stats.write(f)
+    assert_equivalent(KomondorStats(str(written)), KomondorResult(path))
+    assert_equivalent(stats, KomondorResult(str(written)))
+
+
+@pytest.mark.parametrize("content", [
+    "",
+    "[Node_STA_cn_a1]\nthroughput=1\ndelay=0.1\n",
+    "[Node_STA_cn_a1]\ndelay=0.1\nwlan=A\n",
+    "[Node_STA_cn_a1]\nthroughput=nan\ndelay=0.1\nwlan=A\n",
+    "[Node_STA_cn_a1]\nthroughput=\ndelay=0.1\nwlan=A\n",
+], ids=["empty", "no-wlan", "no-throughput", "nan-throughput",
+        "empty-throughput"])
+def test_invalid_results(content, tmp_path):
+    path = tmp_path / "result.cfg"
+    path.write_text(content)
+    assert not KomondorResult(str(path)).is_valid()
+    assert not stats_valid(str(path))
+
+
+def test_extra_fields_kept(tmp_path):
+    path = tmp_path / "result.cfg"
+    path.write_text("[Node_STA_cn_a1]\nthroughput=10\ndelay=0.5\nwlan=A\n"
+                    "rssi=-62.5\nsamples=4\n")
+    node = KomondorStats(str(path))["Node_STA_cn_a1"]
+    assert node.values == {"rssi": -62.5, "samples": 4}
+    written = io.StringIO()
+    KomondorStats(str(path)).write(written)
+    assert "rssi=-62.5\nsamples=4\n" in written.getvalue()
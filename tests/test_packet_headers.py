@@ -0,0 +1,150 @@
+import random
+import socket
+import struct
+import types
+
+import pytest
+
+from terranet.ryu.app.packet_headers import PacketHeaders, packet_headers
+
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_IPV6 = 0x86dd
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_8021AD = 0x88a8
+IPPROTO_UDP = 17
+
+
+def ryu_packet_lib():
+    # os-ken is the maintained fork of ryu with the same packet library
+    for name in ("ryu", "os_ken"):
+        try:
+            return __import__(name + ".lib.packet", fromlist=[
+                "packet", "ethernet", "ipv6"])
+        except ImportError:
+            continue
+    pytest.skip("The reference needs ryu's packet library")
+
+
+def mac(rng):
+    return bytes(rng.getrandbits(8) for _ in range(6))
+
+
+def ipv6_address(rng):
+    words = [rng.choice([0, 0, rng.getrandbits(16)]) for _ in range(8)]
+    if rng.random() < 0.5:
+        # Customer and client addresses of the topologies
+        words[:4] = [0xfd00, 0, 0, rng.getrandbits(16)]
+    return struct.pack("!8H", *words)
+
+
+def ipv6_header(rng, src, dst):
+    payload = struct.pack("!4H", rng.getrandbits(16), rng.getrandbits(16),
+                          8, 0)
+    header = struct.pack("!IHBB16s16s", 6 << 28, len(payload), IPPROTO_UDP,
+                         64, src, dst)
+    return header + payload
+
+
+def ipv4_header(rng):
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20, 0, 0, 64, IPPROTO_UDP,
+                         0, bytes(rng.getrandbits(8) for _ in range(4)),
+                         bytes(rng.getrandbits(8) for _ in range(4)))
+    return header
+
+
+def frame(rng, tags=0, eth_type=ETH_TYPE_IPV6):
+    data = mac(rng) + mac(rng)
+    for i in range(tags):
+        tpid = ETH_TYPE_8021AD if i == 0 and tags > 1 else ETH_TYPE_8021Q
+        data += struct.pack("!HH", tpid, rng.getrandbits(12))
+    data += struct.pack("!H", eth_type)
+    if eth_type == ETH_TYPE_IPV6:
+        data += ipv6_header(rng, ipv6_address(rng), ipv6_address(rng))
+    elif eth_type == ETH_TYPE_IPV4:
+        data += ipv4_header(rng)
+    else:
+        data += bytes(28)
+    return data
+
+
+def frames(count, seed=23):
+    rng = random.Random(seed)
+    return [frame(rng, tags=rng.choice([0, 0, 1, 2]),
+                  eth_type=rng.choice([ETH_TYPE_IPV6, ETH_TYPE_IPV6,
+                                       ETH_TYPE_IPV4, ETH_TYPE_ARP]))
+            for _ in range(count)]
+
+
+def test_ipv6_packet():
+    src = socket.inet_pton(socket.AF_INET6, "fd00::8101:8001:0:0:2")
+    dst = socket.inet_pton(socket.AF_INET6, "fd00:0:0:8101::1")
+    data = (bytes.fromhex("0a0000000001") + bytes.fromhex("0a00000000ff")
+            + struct.pack("!H", ETH_TYPE_IPV6)
+            + ipv6_header(random.Random(0), src, dst))
+    headers = PacketHeaders(data)
+    assert headers.eth_dst == "0a:00:00:00:00:01"
+    assert headers.eth_src == "0a:00:00:00:00:ff"
+    assert headers.eth_type == ETH_TYPE_IPV6
+    assert headers.ipv6_src == "fd00::8101:8001:0:0:2"
+    assert headers.ipv6_dst == "fd00:0:0:8101::1"
+
+
+def test_vlan_tags_skipped():
+    rng = random.Random(0)
+    untagged = frame(rng)
+    tagged = (untagged[:12] + struct.pack("!HHHH", ETH_TYPE_8021AD, 10,
+                                          ETH_TYPE_8021Q, 20)
+              + untagged[12:])
+    headers = PacketHeaders(tagged)
+    expected = PacketHeaders(untagged)
+    for field in PacketHeaders.__slots__:
+        assert getattr(headers, field) == getattr(expected, field)
+
+
+@pytest.mark.parametrize("eth_type", [ETH_TYPE_IPV4, ETH_TYPE_ARP])
+def test_non_ipv6_packet(eth_type):
+    headers = PacketHeaders(frame(random.Random(0), eth_type=eth_type))
+    assert headers.eth_type == eth_type
+    assert headers.ipv6_src is None
+    assert headers.ipv6_dst is None
+
+
+@pytest.mark.parametrize("length", [0, 13, 14, 17, 53, 18 + 39])
+def test_truncated_packet(length):
+    data = frame(random.Random(0), tags=1)[:length]
+    headers = PacketHeaders(data)
+    if length < 14:
+        assert headers.eth_src is None
+        assert headers.eth_type is None
+    else:
+        assert headers.eth_src is not None
+    assert headers.ipv6_src is None
+    assert headers.ipv6_dst is None
+
+
+def test_packet_headers_parsed_once():
+    msg = types.SimpleNamespace(data=frame(random.Random(0)))
+    headers = packet_headers(msg)
+    msg.data = frame(random.Random(1))
+    assert packet_headers(msg) is headers
+
+
+def test_headers_equal_ryu_packet():
+    lib = ryu_packet_lib()
+    for data in frames(2000):
+        pkt = lib.packet.Packet(data)
+        headers = PacketHeaders(data)
+        eth = pkt.get_protocols(lib.ethernet.ethernet)[0]
+        assert headers.eth_dst == eth.dst
+        assert headers.eth_src == eth.src
+        ips = pkt.get_protocols(lib.ipv6.ipv6)
+        if ips:
+            assert headers.eth_type == ETH_TYPE_IPV6
+            assert headers.ipv6_src == ips[0].src
+            assert headers.ipv6_dst == ips[0].dst
+        else:
+            assert headers.eth_type != ETH_TYPE_IPV6
+            assert headers.ipv6_src is None
+            assert headers.ipv6_dst is None